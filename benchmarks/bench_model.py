@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# Times DictModel on wide, deep and mixed documents.
+#
+# Usage: python benchmarks/bench_model.py [nodes]
+import sys
+import time
+
+from PyQt5 import QtCore
+
+from dicteditor.deditor import DictModel
+
+
+def wide(n):
+    return {"key" + str(i): i for i in range(n)}
+
+
+def deep(n):
+    data = leaf = {}
+    for i in range(n // 2):
+        leaf["child"] = {}
+        leaf["value"] = i
+        leaf = leaf["child"]
+    return data
+
+
+def mixed(n):
+    return [{"name": "item" + str(i), "values": [i, i * 0.5, str(i)], "meta": {"ok": True}} for i in range(n // 8)]
+
+
+def walk(model):
+    # Builds every node and reads both columns, as a fully expanded view would
+    stack = [QtCore.QModelIndex()]
+    count = 0
+    while stack:
+        index = stack.pop()
+        model.fetch_all(index)
+        for row in range(model.rowCount(index)):
+            child = model.index(row, 0, index)
+            model.data(child)
+            model.data(child.siblingAtColumn(1))
+            stack.append(child)
+            count += 1
+    return count
+
+
+def deepest_path(model):
+    path, index = [], model.index(0, 0)
+    while model.rowCount(index) > 0:
+        index = model.index(0, 0, index)
+        path.append(model.node(index).key)
+    return path
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    for name, make in [("wide", wide), ("deep", deep), ("mixed", mixed)]:
+        model = DictModel(make(n))
+        start = time.perf_counter()
+        count = walk(model)
+        walked = time.perf_counter() - start
+        path = deepest_path(model)
+        start = time.perf_counter()
+        model.find_path(path)
+        found = time.perf_counter() - start
+        print("{:6} {:8} nodes  walk {:7.3f} s ({:5.2f} us/node)  find depth {:6} {:7.4f} s".format(
+            name, count, walked, walked * 1e6 / count, len(path), found))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+import yaml
+
+from dicteditor.core import codecs, paths
+
+# Handled here without Qt; anything else starts the editor
+COMMANDS = ["get", "set", "del"]
+
+
+def process(command, path, value, filename, use_libyaml=True, compact_json=False, keep_format=False):
+    # Runs command on one file. Returns the filename, the output (the value
+    # for get) and the error, if any, as text.
+    try:
+        data = codecs.load_file(filename, use_libyaml)
+        if command == "get":
+            found = paths.locate(data, path)
+            return filename, json.dumps(found[0][found[1]] if path else data, ensure_ascii=False, default=str), None
+        elif not path:
+            raise KeyError("The whole document cannot be set or deleted")
+        parent, key, found = paths.locate(data, path[:-1])
+        container = parent[key] if found else data
+        if command == "set" and type(container) == dict and not any(str(k) == str(path[-1]) for k in container):
+            # A new key changes its dict, not just a value
+            key, edited = path[-1], found
+        else:
+            _, key, edited = paths.locate(data, path)
+        if command == "set":
+            container[key] = value
+        else:
+            del container[key]
+            edited = found
+        codecs.write_document(filename, data, {edited} if keep_format else None, use_libyaml, compact_json)
+        return filename, None, None
+    except Exception as e:
+        message = e.args[0] if type(e) == KeyError and e.args else str(e)
+        return filename, None, message or type(e).__name__
+
+
+def run(argv):
+    parser = argparse.ArgumentParser(prog="dict-editor", description="Gets, sets or deletes a value in many YAML or JSON files")
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument("path", help="dotted or JSONPath path, e.g. spec.containers[3].env")
+    parser.add_argument("args", nargs="+", metavar="FILE", help="files; for set, the value (as YAML) comes first")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="processes to use")
+    parser.add_argument("--compact", action="store_true", help="compact JSON output")
+    parser.add_argument("--no-libyaml", dest="libyaml", action="store_false", help="use the pure Python YAML parser")
+    parser.add_argument("--keep-format", action="store_true", help="patch the value into each file, keeping its formatting and comments (slower)")
+    options = parser.parse_args(argv)
+
+    try:
+        path = paths.parse_path(options.path)
+    except ValueError as e:
+        parser.error(str(e))
+    value, files = None, options.args
+    if options.command == "set":
+        if len(files) < 2:
+            parser.error("set needs a value and at least one file")
+        value, files = yaml.safe_load(files[0]), files[1:]
+
+    start = time.perf_counter()
+    jobs = max(1, min(options.jobs or 1, len(files)))
+    arguments = [(options.command, path, value, filename, options.libyaml, options.compact, options.keep_format) for filename in files]
+    if jobs == 1:
+        results = (process(*args) for args in arguments)
+        executor = None
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(jobs)
+        # Several files per task, so that small files do not cost a round trip each
+        results = executor.map(process, *zip(*arguments), chunksize=max(1, len(files) // (jobs * 8)))
+    errors = 0
+    try:
+        for filename, output, error in results:
+            if error is not None:
+                errors += 1
+                print("{}: {}".format(filename, error), file=sys.stderr)
+            elif output is not None:
+                print(output if len(files) == 1 else "{}: {}".format(filename, output))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    elapsed = time.perf_counter() - start
+    print("{} files in {:.2f} s ({:.0f} files/s), {} errors".format(len(files), elapsed, len(files) / max(elapsed, 1e-9), errors), file=sys.stderr)
+    return 1 if errors else 0
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        sys.exit(run(sys.argv[1:]))
+    from dicteditor import deditor
+    deditor.main()
@@ -0,0 +1,6 @@
+# The editor's document logic, without Qt: reading and writing files,
+# paths, comparing documents (dicteditor.core.diff) and search. The GUI in dicteditor.deditor is built on it.
+from dicteditor.core.codecs import load_file, save_file, patch_file, read_document, write_document
+from dicteditor.core.document import get_elem_from_text
+from dicteditor.core.paths import parse_path, format_path, locate
+from dicteditor.core.search import SearchIndex
@@ -0,0 +1,568 @@
+import array
+import bisect
+import contextlib
+import io
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+
+import yaml
+
+try:
+    from yaml import CSafeLoader, CSafeDumper
+    LIBYAML = True
+except ImportError:
+    CSafeLoader, CSafeDumper = yaml.SafeLoader, yaml.SafeDumper
+    LIBYAML = False
+
+# Long lists of plain ints or floats are kept as arrays of these typecodes
+ARRAY_TYPES = {"q": int, "d": float}
+ARRAY_MIN_LENGTH = 1000
+
+
+def encode_array(value):
+    if type(value) == array.array:
+        return value.tolist()
+    elif type(value) == LazyContainer:
+        return value.load()
+    raise TypeError("Object of type {} is not serializable".format(type(value).__name__))
+
+
+class LazyContainer:
+    # A dict or list of a mapped JSON file that has not been decoded yet:
+    # the bytes from start to end of doc. kind is dict or list.
+    __slots__ = ["doc", "start", "end", "kind"]
+
+    def __init__(self, doc, start, end, kind):
+        self.doc = doc
+        self.start = start
+        self.end = end
+        self.kind = kind
+
+    def load(self):
+        return self.doc.decode(self.start, self.end, self.kind)
+
+
+class YamlDumper(CSafeDumper):
+    pass
+
+
+class PureYamlDumper(yaml.SafeDumper):
+    pass
+
+
+for dumper in [YamlDumper, PureYamlDumper]:
+    dumper.add_representer(array.array, lambda dumper, value: dumper.represent_list(value.tolist()))
+    dumper.add_representer(LazyContainer, lambda dumper, value: dumper.represent_data(value.load()))
+
+# JSON libraries as (name, loads, dumps), fastest first. loads() takes the
+# raw bytes of the file and dumps() returns compact UTF-8 bytes.
+JSON_BACKENDS = []
+
+try:
+    import orjson
+    JSON_BACKENDS.append(("orjson", orjson.loads, lambda data: orjson.dumps(data, default=encode_array, option=orjson.OPT_NON_STR_KEYS)))
+except ImportError:
+    pass
+
+try:
+    import rapidjson
+    JSON_BACKENDS.append(("rapidjson", rapidjson.loads, lambda data: rapidjson.dumps(data, ensure_ascii=False, default=encode_array).encode()))
+except ImportError:
+    pass
+
+try:
+    import ujson
+    JSON_BACKENDS.append(("ujson", ujson.loads, lambda data: ujson.dumps(data, ensure_ascii=False, default=encode_array).encode()))
+except ImportError:
+    pass
+
+JSON_BACKENDS.append(("json", json.loads, lambda data: json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=encode_array).encode()))
+
+LONG_NUMBER = re.compile(rb"\d{20}")
+
+
+def yaml_backend(use_libyaml=True):
+    return "libyaml" if use_libyaml and LIBYAML else "python"
+
+
+def json_backend():
+    return JSON_BACKENDS[0][0]
+
+
+def load_yaml(stream, use_libyaml=True):
+    loader = CSafeLoader if use_libyaml else yaml.SafeLoader
+    return yaml.load(stream, Loader=loader)
+
+
+def dump_yaml(data, stream, use_libyaml=True, encoding=None):
+    dumper = YamlDumper if use_libyaml else PureYamlDumper
+    yaml.dump(data, stream, Dumper=dumper, encoding=encoding)
+
+
+def load_json(stream):
+    return decode_json(stream.read())
+
+
+def decode_json(raw):
+    if LONG_NUMBER.search(raw):
+        # Some fast libraries turn integers over 64 bits into floats
+        return json.loads(raw)
+    try:
+        return JSON_BACKENDS[0][1](raw)
+    except Exception:
+        # Let the standard library decide, and word the error if there is one
+        return json.loads(raw)
+
+
+def dump_json(data, stream, compact=False):
+    if not compact:
+        # Same bytes as json.dump()
+        stream.write(json.dumps(data, default=encode_array).encode())
+        return
+    try:
+        stream.write(JSON_BACKENDS[0][2](data))
+    except (TypeError, ValueError, OverflowError):
+        # e.g. integers too large or keys the fast library refuses
+        stream.write(JSON_BACKENDS[-1][2](data))
+
+
+def fits_array(values, elem):
+    if type(elem) != ARRAY_TYPES[values.typecode]:
+        return False
+    return type(elem) == float or -2 ** 63 <= elem < 2 ** 63
+
+
+def compact_lists(data, min_length=ARRAY_MIN_LENGTH):
+    # Replaces long lists of only ints or only floats by arrays, in place.
+    # Returns data, which is itself replaced if it is such a list.
+    def compact(values):
+        if len(values) < min_length:
+            return values
+        for typecode, elem_type in ARRAY_TYPES.items():
+            if all(type(elem) == elem_type for elem in values):
+                try:
+                    return array.array(typecode, values)
+                except OverflowError:
+                    return values
+        return values
+
+    stack = [data]
+    while stack:
+        container = stack.pop()
+        for key, value in container.items() if type(container) == dict else enumerate(container):
+            if type(value) == list:
+                value = compact(value)
+                if type(value) == array.array:
+                    container[key] = value
+                    continue
+            if type(value) in [dict, list]:
+                stack.append(value)
+    if type(data) == list:
+        return compact(data)
+    return data
+
+
+class ProgressReader:
+    # Binary file wrapper that reports the bytes read so far to callback.
+    # The callback may raise to abort the load.
+
+    def __init__(self, stream, callback, chunk_size=1 << 22):
+        self.stream = stream
+        self.callback = callback
+        self.chunk_size = chunk_size
+        self.count = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = []
+            chunk = self.read(self.chunk_size)
+            while chunk:
+                chunks.append(chunk)
+                chunk = self.read(self.chunk_size)
+            return b"".join(chunks)
+        data = self.stream.read(size)
+        self.count += len(data)
+        self.callback(self.count)
+        return data
+
+
+def load_file(filename, use_libyaml=True, progress=None, mapped=False):
+    if mapped and filename.endswith(".json"):
+        return MappedJson(filename, progress).root()
+    with open(filename, "rb") as f:
+        if progress is not None:
+            f = ProgressReader(f, progress)
+        if filename.endswith(".json"):
+            return load_json(f)
+        return load_yaml(f, use_libyaml)
+
+
+class ProgressWriter:
+    # Binary file wrapper that reports the bytes written so far to callback
+
+    def __init__(self, stream, callback):
+        self.stream = stream
+        self.callback = callback
+        self.count = 0
+
+    def write(self, data):
+        self.stream.write(data)
+        self.count += len(data)
+        self.callback(self.count)
+        return len(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+# Buffer size for writing files
+WRITE_BUFFER = 1 << 22
+# Read once, while no other thread can be creating files
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+@contextlib.contextmanager
+def atomic_open(filename, progress=None):
+    # Binary stream to a temporary file beside filename, which replaces it
+    # only once completely written and on disk. On errors filename is left
+    # as it was. The data may still point into a mapped filename, which is
+    # why it is never truncated in place. Symbolic links are written through.
+    filename = os.path.realpath(filename)
+    directory = os.path.dirname(filename)
+    fd, temp = tempfile.mkstemp(prefix="." + os.path.basename(filename) + ".", suffix=".tmp", dir=directory)
+    try:
+        with open(fd, "wb", buffering=WRITE_BUFFER) as f:
+            yield f if progress is None else ProgressWriter(f, progress)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(filename):
+            shutil.copymode(filename, temp)
+        else:
+            # mkstemp() makes the file private: new files get the usual mode instead
+            os.chmod(temp, 0o666 & ~UMASK)
+        os.replace(temp, filename)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # The rename itself is only durable once the directory is synced
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def save_file(filename, data, use_libyaml=True, compact_json=False, mapped=False, progress=None):
+    with atomic_open(filename, progress) as f:
+        if filename.endswith(".json") and mapped:
+            # Copies the parts of the mapped file that were never decoded
+            write_json(data, f, compact_json)
+        elif filename.endswith(".json"):
+            dump_json(data, f, compact_json)
+        else:
+            dump_yaml(data, f, use_libyaml, "utf-8")
+
+
+def read_document(filename, use_libyaml=True, progress=None, mapped=False):
+    # The file as the editor holds it, long lists of numbers as arrays
+    return compact_lists(load_file(filename, use_libyaml, progress, mapped))
+
+
+def write_document(filename, data, paths=None, use_libyaml=True, compact_json=False, mapped=False, progress=None):
+    # Patches the values at paths into the file when given and possible,
+    # or else writes data whole
+    if paths is None or not patch_file(filename, data, paths, use_libyaml, compact_json, progress):
+        save_file(filename, data, use_libyaml, compact_json, mapped, progress)
+
+
+# Everything up to the next bracket that is not inside a string
+JSON_TOKEN = re.compile(rb'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*[\[\]{}]')
+JSON_VALUE = re.compile(rb"\S")
+JSON_KINDS = {ord("{"): dict, ord("["): list}
+JSON_CLOSING = {ord("}"): ord("{"), ord("]"): ord("[")}
+# Files over this size are mapped instead of read, if asked to
+MAPPED_MIN_SIZE = 64 << 20
+# Dicts and lists over this size are indexed and decoded one level at a time
+INDEX_MIN_SIZE = 256 << 10
+
+
+class MappedJson:
+    # A JSON file mapped in memory. One pass over it finds the byte range of
+    # every large dict and list; each of those is decoded only when load()
+    # is called on its LazyContainer, leaving its own large children as
+    # further LazyContainers. Smaller values are decoded whole.
+
+    def __init__(self, filename, progress=None):
+        with open(filename, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(filename) else b""
+        self.ends = self.scan(progress)
+        self.starts = sorted(self.ends)
+
+    def scan(self, progress=None):
+        data = self.data
+        ends, stack = {}, []
+        step = max(len(data) // 1000, 1 << 20)
+        report = step
+        for match in JSON_TOKEN.finditer(data):
+            pos = match.end() - 1
+            char = data[pos]
+            if char in JSON_KINDS:
+                stack.append(pos)
+            else:
+                if not stack or data[stack[-1]] != JSON_CLOSING[char]:
+                    raise ValueError("Unexpected '{}' at byte {}".format(chr(char), pos))
+                start = stack.pop()
+                if pos + 1 - start >= INDEX_MIN_SIZE:
+                    ends[start] = pos + 1
+            if progress is not None and pos >= report:
+                progress(pos)
+                report = pos + step
+        if stack:
+            raise ValueError("Unclosed '{}' at byte {}".format(chr(data[stack[-1]]), stack[-1]))
+        return ends
+
+    def root(self):
+        first = JSON_VALUE.search(self.data)
+        first = first.start() if first else 0
+        end = len(self.data)
+        while end > first and self.data[end - 1] in b" \t\r\n":
+            end -= 1
+        if first < end and self.data[first] in JSON_KINDS:
+            return self.decode(first, end, JSON_KINDS[self.data[first]])
+        return decode_json(self.data[first:end])
+
+    def decode(self, start, end, kind):
+        if end - start < INDEX_MIN_SIZE:
+            return compact_lists(decode_json(self.data[start:end]))
+        value = kind()
+        brackets = b"{}" if kind == dict else b"[]"
+        pos = start + 1
+        i = bisect.bisect_right(self.starts, start)
+        while i < len(self.starts) and self.starts[i] < end:
+            child = self.starts[i]
+            child_end = self.ends[child]
+            # The entries up to this child are decoded together, with a
+            # null standing in for the child itself
+            part = decode_json(brackets[:1] + self.text_between(pos, child) + b"null" + brackets[1:])
+            lazy = LazyContainer(self, child, child_end, JSON_KINDS[self.data[child]])
+            if kind == dict:
+                part[next(reversed(part))] = lazy
+                value.update(part)
+            else:
+                part[-1] = lazy
+                value.extend(part)
+            pos = child_end
+            # Past the indexed dicts and lists inside the child
+            i = bisect.bisect_left(self.starts, child_end, i + 1)
+        rest = self.text_between(pos, end - 1)
+        if rest:
+            part = decode_json(brackets[:1] + rest + brackets[1:])
+            if kind == dict:
+                value.update(part)
+            else:
+                value.extend(part)
+        return compact_lists(value)
+
+    def text_between(self, start, end):
+        # Entries between two positions, without the comma after the entry before
+        text = self.data[start:end].strip()
+        if start > 0 and self.data[start - 1] in JSON_CLOSING and text.startswith(b","):
+            text = text[1:]
+        return text
+
+
+def has_lazy(data):
+    stack = [data]
+    while stack:
+        container = stack.pop()
+        for value in container.values() if type(container) == dict else container:
+            if type(value) == LazyContainer:
+                return True
+            elif type(value) in [dict, list]:
+                stack.append(value)
+    return False
+
+
+def write_json(data, stream, compact=False):
+    # Writes data like dump_json(), copying the parts of a mapped file that
+    # were never decoded as they are
+    separators = (",", ":") if compact else (", ", ": ")
+    item_separator, key_separator = separators[0].encode(), separators[1].encode()
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if type(value) == bytes:
+            stream.write(value)
+        elif type(value) == LazyContainer:
+            for pos in range(value.start, value.end, 1 << 22):
+                stream.write(value.doc.data[pos:min(pos + (1 << 22), value.end)])
+        elif type(value) in [dict, list] and not has_lazy(value):
+            # Nothing mapped below this one: written in one go
+            stream.write(json.dumps(value, separators=separators, default=encode_array).encode())
+        elif type(value) == dict:
+            items = []
+            for key, elem in value.items():
+                key = json.dumps(key if type(key) == str else json.dumps(key)).encode()
+                items.extend([item_separator, key + key_separator, elem])
+            stack.append(b"}")
+            stack.extend(reversed(items[1:]))
+            stack.append(b"{")
+        elif type(value) == list:
+            items = []
+            for elem in value:
+                items.extend([item_separator, elem])
+            stack.append(b"]")
+            stack.extend(reversed(items[1:]))
+            stack.append(b"[")
+        else:
+            stream.write(json.dumps(value, default=encode_array).encode())
+
+
+JSON_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+JSON_SCALAR = re.compile(rb'[^,\]}\s]+')
+JSON_SPACE = re.compile(rb'[ \t\r\n]*')
+
+
+def json_value_end(source, pos):
+    char = source[pos]
+    if char in JSON_KINDS:
+        depth = 0
+        for match in JSON_TOKEN.finditer(source, pos):
+            depth += 1 if source[match.end() - 1] in JSON_KINDS else -1
+            if depth == 0:
+                return match.end()
+        raise ValueError("Unclosed '{}' at byte {}".format(chr(char), pos))
+    match = (JSON_STRING if char == ord('"') else JSON_SCALAR).match(source, pos)
+    if match is None:
+        raise ValueError("No value at byte {}".format(pos))
+    return match.end()
+
+
+def json_span(source, path):
+    # Byte range of the value at path in the JSON text source, or None
+    start = JSON_SPACE.match(source).end()
+    for key in path:
+        kind = JSON_KINDS.get(source[start])
+        pos = JSON_SPACE.match(source, start + 1).end()
+        start, i = None, 0
+        while kind is not None and source[pos] not in JSON_CLOSING:
+            found = i == key
+            if kind == dict:
+                name = JSON_STRING.match(source, pos)
+                found = json.loads(name.group()) == key
+                pos = JSON_SPACE.match(source, JSON_SPACE.match(source, name.end()).end() + 1).end()
+            if found:
+                start = pos
+                break
+            pos = JSON_SPACE.match(source, json_value_end(source, pos)).end()
+            if source[pos] == ord(","):
+                pos = JSON_SPACE.match(source, pos + 1).end()
+            i += 1
+        if start is None:
+            return None
+    return start, json_value_end(source, start)
+
+
+def yaml_text(value, flow):
+    # A scalar as YAML on one line, quoted if it could be misread there
+    if type(value) == str and flow:
+        return json.dumps(value)
+    text = yaml.safe_dump(value, width=float("inf"), allow_unicode=True)
+    text = text[:-5] if text.endswith("\n...\n") else text.rstrip("\n")
+    return json.dumps(value) if "\n" in text else text
+
+
+def yaml_span(root, path, text):
+    # Character range of the scalar at path in a composed YAML document of
+    # text and whether it sits in a flow collection, or None
+    constructor = yaml.constructor.SafeConstructor()
+    node, flow = root, False
+    for key in path:
+        if text.startswith(("&", "!"), node.start_mark.index):
+            # An anchor, which aliases share with it, or a tag: the node's
+            # text holds more than its value
+            return None
+        flow = flow or getattr(node, "flow_style", False)
+        if type(node) == yaml.MappingNode:
+            values = [value for name, value in node.value if type(name) == yaml.ScalarNode and constructor.construct_object(name) == key]
+            node = values[-1] if values else None
+        elif type(node) == yaml.SequenceNode and type(key) == int and 0 <= key < len(node.value):
+            node = node.value[key]
+        else:
+            node = None
+        if node is None:
+            return None
+    if type(node) != yaml.ScalarNode or node.style in ["|", ">"] or text.startswith(("&", "!"), node.start_mark.index):
+        # Containers, and block scalars that end with the line break
+        return None
+    return node.start_mark.index, node.end_mark.index, flow
+
+
+def value_at(data, path):
+    for key in path:
+        data = data[key]
+    return data
+
+
+def patch_file(filename, data, paths, use_libyaml=True, compact_json=False, progress=None):
+    # Saves data over the file it was loaded from by rewriting only the values
+    # at paths and copying the rest of the file as it is, formatting and
+    # comments included. Returns False, leaving the file alone, if some value
+    # cannot be found in the file or, in YAML, if it is not a scalar.
+    kept = []
+    for path in sorted(paths, key=len):
+        if not any(path[:len(other)] == other for other in kept):
+            kept.append(path)
+    if () in kept or not os.path.getsize(filename):
+        return False
+    with open(filename, "rb") as f:
+        source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        patches = []
+        if filename.endswith(".json"):
+            for path in kept:
+                span = json_span(source, path)
+                if span is None:
+                    return False
+                text = io.BytesIO()
+                write_json(value_at(data, path), text, compact_json)
+                patches.append((span[0], span[1], text.getvalue()))
+        else:
+            text = source[:].decode("utf-8")
+            root = yaml.compose(text, Loader=CSafeLoader if use_libyaml else yaml.SafeLoader)
+            for path in kept:
+                span = yaml_span(root, path, text) if root is not None else None
+                value = value_at(data, path)
+                if span is None or type(value) in [dict, list, array.array]:
+                    return False
+                patches.append((span[0], span[1], yaml_text(value, span[2]).encode()))
+            # From character offsets to offsets in the UTF-8 bytes of the file
+            patches.sort(key=lambda patch: patch[0])
+            offsets, chars, size = [], 0, 0
+            for start, end, patch in patches:
+                size += len(text[chars:start].encode())
+                offset = size
+                size += len(text[start:end].encode())
+                offsets.append((offset, size, patch))
+                chars = end
+            patches = offsets
+        patches.sort(key=lambda patch: patch[0])
+        with atomic_open(filename, progress) as f:
+            pos = 0
+            for start, end, text in patches + [(len(source), len(source), b"")]:
+                for chunk in range(pos, start, WRITE_BUFFER):
+                    f.write(source[chunk:min(chunk + WRITE_BUFFER, start)])
+                f.write(text)
+                pos = end
+        return True
+    except (ValueError, KeyError, IndexError, TypeError, UnicodeDecodeError, yaml.YAMLError):
+        return False
+    finally:
+        source.close()
@@ -0,0 +1,32 @@
+import array
+
+
+def comparable(old, new):
+    # Values that can be compared and changed in place: same type, and same
+    # typecode for arrays
+    return type(old) == type(new) and (type(old) != array.array or old.typecode == new.typecode)
+
+
+def dict_changes(old, new):
+    # The keys removed from old, those kept and those appended in new, or
+    # None if new has the kept keys in another order
+    kept = [key for key in new if key in old]
+    old_kept = [key for key in old if key in new]
+    if old_kept != kept or list(new)[:len(kept)] != kept:
+        return None
+    elif any(type(key) != type(old_key) for key, old_key in zip(kept, old_kept)):
+        # Equal keys of another type, like 1 and True, are not the same key
+        return None
+    return [key for key in old if key not in new], kept, list(new)[len(kept):]
+
+
+def same(old, new):
+    # old == new, but also telling 1, 1.0 and True apart and minding the
+    # order of dict keys
+    if not comparable(old, new):
+        return False
+    elif type(old) == dict:
+        return list(old) == list(new) and all(type(key) == type(other) and same(old[key], new[other]) for key, other in zip(old, new))
+    elif type(old) == list:
+        return len(old) == len(new) and all(same(a, b) for a, b in zip(old, new))
+    return old == new
@@ -0,0 +1,210 @@
+import array
+import itertools
+
+import yaml
+
+from dicteditor.core import codecs
+
+BOOL_TEXT = {"True": True, "true": True, "False": False, "false": False}
+NONE_TEXT = ["None", "null", "~"]
+SCALAR_TYPES = [str, int, float, bool, type(None)]
+
+
+def get_elem_from_text(text, previous=None):
+    # Text left as shown keeps the value it came from, exactly
+    if text == str(previous):
+        return previous
+    # A YAML tag changes the type on purpose, e.g. !!int 5 or !!null
+    if text.startswith("!!"):
+        try:
+            value = yaml.safe_load(text)
+        except (yaml.YAMLError, ValueError):
+            return text
+        # Only to the scalars both YAML and JSON hold, which are hashable keys too
+        return value if type(value) in SCALAR_TYPES else text
+    # Otherwise strings stay strings, and numbers keep their type when the text fits it
+    if type(previous) == str:
+        return text
+    elif type(previous) in [int, float]:
+        try:
+            return type(previous)(text)
+        except ValueError:
+            pass
+    try:
+        value = int(text)
+    except ValueError:
+        try:
+            value = float(text)
+        except ValueError:
+            value = BOOL_TEXT.get(text, None if text in NONE_TEXT else text)
+    return value
+
+
+LIST_TYPES = [list, array.array]
+CONTAINER_TYPES = [dict, list, array.array, codecs.LazyContainer]
+# Lists longer than this are shown as groups of this many entries
+GROUP_SIZE = 10000
+
+
+class Node:
+    __slots__ = ["parent", "key", "value", "children", "pending", "row"]
+
+    def __init__(self, parent, key, value):
+        self.parent = parent
+        # Dict key, None for list entries
+        self.key = key
+        # Scalar, or the dict/list/array of the loaded document itself
+        self.value = value
+        self.children = None
+        # Iterator over the entries whose nodes have not been built yet
+        self.pending = None
+        self.row = 0
+
+    def is_dict(self):
+        return type(self.value) == dict
+
+    def value_type(self):
+        # What the value shows as: dict or list for parts of a mapped file not decoded yet
+        return self.value.kind if type(self.value) == codecs.LazyContainer else type(self.value)
+
+    def resolve(self):
+        # Decodes a part of a mapped file, in place in the document
+        if type(self.value) == codecs.LazyContainer:
+            self.value = self.value.load()
+            self.owner().value[self.position()] = self.value
+
+    def is_list(self):
+        return type(self.value) in LIST_TYPES
+
+    def is_group(self):
+        return False
+
+    def is_grouped(self):
+        if self.children:
+            return self.children[0].is_group()
+        return self.children is None and type(self.value) in LIST_TYPES and len(self.value) > GROUP_SIZE
+
+    def total_rows(self):
+        if type(self.value) not in CONTAINER_TYPES:
+            return 0
+        elif type(self.value) == codecs.LazyContainer:
+            # Only indexed dicts and lists are left undecoded, and those are never empty
+            return 1
+        elif self.is_grouped():
+            return len(self.children) if self.children is not None else -(-len(self.value) // GROUP_SIZE)
+        return len(self.value)
+
+    def can_fetch(self):
+        return type(self.value) in CONTAINER_TYPES and (self.children is None or self.pending is not None)
+
+    def fetch(self, count=None):
+        self.resolve()
+        if self.children is None:
+            if self.is_grouped():
+                # Groups are few and cheap: they are all built at once
+                size = len(self.value)
+                self.children = [GroupNode(self, start, min(GROUP_SIZE, size - start)) for start in range(0, size, GROUP_SIZE)]
+                for i, child in enumerate(self.children):
+                    child.row = i
+                return
+            self.children = []
+            if type(self.value) == dict:
+                self.pending = iter(self.value.items())
+            elif type(self.value) in LIST_TYPES:
+                self.pending = ((None, value) for value in self.value)
+        if self.pending is None:
+            return
+        for key, value in itertools.islice(self.pending, count):
+            child = Node(self, key, value)
+            child.row = len(self.children)
+            self.children.append(child)
+        if len(self.children) == len(self.value):
+            self.pending = None
+
+    def restart(self):
+        # After entries without a row were added or removed: goes on from
+        # the first entry without a row, as rows are built in order
+        if self.pending is None:
+            return
+        elif len(self.children) >= len(self.value):
+            self.pending = None
+        elif type(self.value) == dict:
+            self.pending = itertools.islice(iter(self.value.items()), len(self.children), None)
+        else:
+            self.pending = ((None, value) for value in itertools.islice(self.value, len(self.children), None))
+
+    def get_children(self):
+        self.fetch()
+        return self.children
+
+    def get_row(self):
+        # The cached row is only ever too high, by the rows removed before it:
+        # a few steps back usually find it again without scanning the siblings
+        siblings = self.parent.children
+        row = min(self.row, len(siblings) - 1)
+        for row in range(row, max(row - 8, -1), -1):
+            if siblings[row] is self:
+                self.row = row
+                return row
+        self.row = siblings.index(self)
+        return self.row
+
+    def owner(self):
+        # Node holding the dict/list this entry is in, past any group
+        return self.parent.parent if self.parent.is_group() else self.parent
+
+    def position(self):
+        # Key or index of this entry in the owner's dict/list
+        if self.parent.is_dict():
+            return self.key
+        elif self.parent.is_group():
+            return self.parent.start + self.get_row()
+        return self.get_row()
+
+
+class GroupNode(Node):
+    # A range of the entries of a long list: count entries from start on
+    __slots__ = ["start", "count"]
+
+    def __init__(self, parent, start, count):
+        super().__init__(parent, None, None)
+        self.start = start
+        self.count = count
+
+    def is_group(self):
+        return True
+
+    def is_grouped(self):
+        return False
+
+    def total_rows(self):
+        return self.count
+
+    def can_fetch(self):
+        return self.children is None or self.pending is not None
+
+    def fetch(self, count=None):
+        if self.children is None:
+            self.children = []
+        # Read through the list at fetch time: start moves as entries before it are removed
+        values = self.parent.value
+        first = len(self.children)
+        last = self.count if count is None else min(self.count, first + count)
+        for i in range(first, last):
+            child = Node(self, None, values[self.start + i])
+            child.row = i
+            self.children.append(child)
+        self.pending = True if last < self.count else None
+
+
+class ShownNode(Node):
+    # An entry a filter shows, built without its siblings: at is its
+    # position in the list holding it, as its row is not
+    __slots__ = ["at"]
+
+    def __init__(self, parent, key, value, at):
+        super().__init__(parent, key, value)
+        self.at = at
+
+    def position(self):
+        return self.key if self.parent.is_dict() else self.at
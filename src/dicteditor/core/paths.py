@@ -0,0 +1,66 @@
+import array
+import re
+
+# One step of a path: .name, [index], ['name'] or ["name"]
+PATH_STEP = re.compile(r"""\.?([^.\[\]'"]+)|\[(-?\d+)\]|\['((?:[^'\\]|\\.)*)'\]|\["((?:[^"\\]|\\.)*)"\]""")
+ESCAPE = re.compile(r"\\(.)")
+
+
+def parse_path(text):
+    # Keys of a dotted or JSONPath path such as spec.containers[3].env or
+    # $['spec']['containers'][3]. Dotted steps are strings, even if made of
+    # digits: it is for the one walking the path to read them as positions.
+    text = text.strip()
+    if text.startswith("$"):
+        text = text[1:]
+    path, pos = [], 0
+    while pos < len(text):
+        match = PATH_STEP.match(text, pos)
+        if match is None or match.end() == pos or match.group(1) is not None and pos > 0 and text[pos] != ".":
+            raise ValueError("Unexpected '{}' at position {} of the path".format(text[pos], pos))
+        name, index, single, double = match.groups()
+        if index is not None:
+            path.append(int(index))
+        else:
+            quoted = single if single is not None else double
+            path.append(name if quoted is None else ESCAPE.sub(r"\1", quoted))
+        pos = match.end()
+    return tuple(path)
+
+
+def format_path(path):
+    text = "$"
+    for key in path:
+        if type(key) == int:
+            text += "[" + str(key) + "]"
+        elif type(key) == str and re.fullmatch(r"[^.\[\]'\"\\]+", key):
+            text += "." + key
+        else:
+            text += "[" + repr(str(key)) + "]"
+    return text
+
+
+def locate(data, path):
+    # The dict or list holding the entry at path, its key or position there,
+    # and path with the keys and positions as they are in data. Steps are
+    # read loosely, as in parse_path: digits may be positions, negative
+    # positions count from the end and text matches keys of any type.
+    parent, key, found = None, None, []
+    for step in path:
+        if type(data) == dict:
+            if step not in data:
+                step = next((k for k in data if str(k) == str(step)), step)
+            if step not in data:
+                raise KeyError("No key {!r} at {}".format(step, format_path(found)))
+        elif type(data) in [list, array.array]:
+            if type(step) == str and step.lstrip("-").isdigit():
+                step = int(step)
+            if type(step) != int or not -len(data) <= step < len(data):
+                raise KeyError("No position {} at {}".format(step, format_path(found)))
+            step = step % len(data)
+        else:
+            raise KeyError("Not a dict or list at {}".format(format_path(found)))
+        parent, key = data, step
+        data = data[step]
+        found.append(step)
+    return parent, key, tuple(found)
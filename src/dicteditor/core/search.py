@@ -0,0 +1,121 @@
+import array
+import bisect
+import re
+
+from dicteditor.core import codecs
+
+WORD = re.compile(r"\w+")
+SCALAR_SKIP = (dict, list, array.array, codecs.LazyContainer)
+
+
+def get_words(name, value):
+    # Lowercase words of a dict key (None for list entries) and of a scalar value
+    text = "" if name is None else str(name)
+    if not isinstance(value, SCALAR_SKIP):
+        text += " " + str(value)
+    return set(WORD.findall(text.lower()))
+
+
+class SearchIndex:
+    # Inverted index from the words of keys and values to the entries holding
+    # them. Entries are numbered in document order, so that each one's
+    # descendants are the entries from it up to its end; 0 is the document
+    # itself. Parts of mapped files that were never decoded are not indexed.
+
+    def __init__(self):
+        self.parents = array.array("q")
+        self.ends = array.array("q")
+        # Dict key or list position of each entry
+        self.keys = []
+        self.words = {}
+        self.vocabulary = []
+
+    def build(self, data, progress=None):
+        stack = [(-1, None, False, data)]
+        while stack:
+            item = stack.pop()
+            if type(item) == int:
+                # Every entry under item has been numbered
+                self.ends[item] = len(self.keys)
+                continue
+            parent, key, in_dict, value = item
+            entry = len(self.keys)
+            self.parents.append(parent)
+            self.keys.append(key)
+            self.ends.append(entry + 1)
+            for word in get_words(key if in_dict else None, value):
+                self.words.setdefault(word, []).append(entry)
+            if type(value) == dict:
+                stack.append(entry)
+                stack.extend(reversed([(entry, k, True, v) for k, v in value.items()]))
+            elif type(value) in [list, array.array]:
+                stack.append(entry)
+                stack.extend(reversed([(entry, i, False, v) for i, v in enumerate(value)]))
+            if progress is not None and entry % 10000 == 0:
+                progress(entry)
+        self.vocabulary = sorted(self.words)
+        return self
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, text):
+        # Entries having, for every word of text, a word starting with it
+        found = None
+        for word in set(WORD.findall(text.lower())):
+            matches = []
+            i = bisect.bisect_left(self.vocabulary, word)
+            while i < len(self.vocabulary) and self.vocabulary[i].startswith(word):
+                matches.append(self.words[self.vocabulary[i]])
+                i += 1
+            if found is None and len(matches) == 1:
+                # The common case: no need to merge anything
+                found = matches[0]
+                continue
+            entries = set().union(*matches)
+            found = entries if found is None else entries.intersection(found)
+            if not found:
+                break
+        if not found:
+            return []
+        return list(found) if type(found) == list else sorted(found)
+
+    def path(self, entry):
+        path = []
+        while entry > 0:
+            path.append(self.keys[entry])
+            entry = self.parents[entry]
+        return tuple(reversed(path))
+
+    def find(self, path):
+        entry = 0
+        for key in path:
+            child = entry + 1
+            while child < self.ends[entry] and self.keys[child] != key:
+                child = self.ends[child]
+            if child >= self.ends[entry]:
+                return None
+            entry = child
+        return entry
+
+    def edit(self, path, old_key, old_value, new_key, new_value):
+        # An entry renamed or given a new value in place; keys are None for
+        # list entries
+        entry = self.find(path)
+        if entry is None:
+            return
+        if new_key is not None:
+            self.keys[entry] = new_key
+        old, new = get_words(old_key, old_value), get_words(new_key, new_value)
+        for word in old - new:
+            self.words[word].remove(entry)
+            if not self.words[word]:
+                del self.words[word]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, word)]
+        for word in new - old:
+            if word not in self.words:
+                self.words[word] = []
+                bisect.insort(self.vocabulary, word)
+            # Lists stay in document order
+            bisect.insort(self.words[word], entry)
+
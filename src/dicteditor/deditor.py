@@ -1,4 +1,7 @@
 #!/usr/bin/env python3
+import array
+import bisect
+import collections
 import os.path
 import re
 import sys
@@ -6,323 +9,870 @@ from dicteditor.utils import sum
 from PyQt5 import QtCore, QtGui
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont, QIcon
-from PyQt5.QtWidgets import QApplication, QMainWindow, QTreeWidget, QTreeWidgetItem, QWidget, QVBoxLayout, QPushButton, QStyledItemDelegate, QLineEdit, QLabel, \
-    QHeaderView, QMenu, QFileDialog, QErrorMessage, QMessageBox
+from PyQt5.QtWidgets import QApplication, QMainWindow, QTreeView, QWidget, QVBoxLayout, QPushButton, QStyledItemDelegate, QLineEdit, \
+    QHeaderView, QMenu, QFileDialog, QErrorMessage, QMessageBox, QProgressBar, QAbstractItemView, QCheckBox
 
-import json
-
-import yaml
 import easyconfig
 import dicteditor.resources
+from dicteditor.core import codecs, diff, paths, search
+from dicteditor.core.document import LIST_TYPES, CONTAINER_TYPES, GROUP_SIZE, Node, GroupNode, ShownNode, get_elem_from_text
+from dicteditor.expansion import ExpansionStore
 from easyconfig.EasyConfig import EasyConfig
 
 
-def get_elem_from_text(text):
-    try:
-        value = int(text)
-    except ValueError:
-        try:
-            value = float(text)
-        except ValueError:
-            value = text
-    return value
-
-
-class Item(QTreeWidgetItem):
+class DictModel(QtCore.QAbstractItemModel):
     color_int = QtCore.Qt.darkGreen
     color_float = QtCore.Qt.cyan
     color_string = QtCore.Qt.black
     color_dict = QtCore.Qt.red
     color_list = QtCore.Qt.darkGreen
-
-    def __init__(self, parent, data):
-        super().__init__(parent, data)
-        self.item_flags = QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsEditable | QtCore.Qt.ItemIsSelectable
-        self.setFlags(self.item_flags)
-        self.key_type = type(self.get_key())
-        self.value_type = type(self.get_value())
-        self.update_type()
-        self.widgets = {}
-
-    def readonly(self, columns):
-        for column in columns:
-            label = QLabel(self.data(column, 0))
-            self.treeWidget().setItemWidget(self, column, label)
-            label.setStyleSheet("color:" + self.foreground(column).color().name())
-            # Necessary to make resizeColumnsToContents() work
-            self.setData(column, 0, " " * len(self.data(column, 0)))
-            self.widgets[column] = label
-
-    def get_key(self):
-        return get_elem_from_text(self.text(0))
-
-    def update_type(self):
-        self.key_type = type(self.get_key())
-        self.value_type = type(self.get_value())
-
-    def get_value(self):
-        return get_elem_from_text(self.text(1))
-
-    def setText(self, column: int, atext: str) -> None:
-        if self.widgets.get(column) is not None:
-            self.widgets[column].setText(atext)
-            super(Item, self).setText(column, " " * len(atext))
+    FETCH_BATCH = 1000
+    # Path, old key and value, new key and value of an entry edited in place;
+    # keys are None for list entries
+    entry_edited = QtCore.pyqtSignal(tuple, object, object, object, object)
+    # Anything else changed in the document: entries added, removed or replaced
+    structure_changed = QtCore.pyqtSignal()
+    # Per-type lookups for the paint path, instead of chains of type tests
+    container_text = {dict: "{dict}", list: "[list]", array.array: "[list]"}
+    type_colors = {str: "color_string", int: "color_int", float: "color_float", dict: "color_dict", list: "color_list",
+                   array.array: "color_list"}
+
+    def __init__(self, data=None):
+        super().__init__()
+        # Invisible root: its only child is the document's top-level dict/list
+        self.root = Node(None, None, [])
+        # Paths of the nodes edited since the data was loaded or saved
+        self.dirty = set()
+        # Set while the document is being saved, refusing edits
+        self.locked = False
+        # The rows of the whole document while a filter shows only some, and
+        # whether they missed edits made meanwhile
+        self.unfiltered = None
+        self.filter_edited = False
+        if data is not None:
+            self.set_data(data)
+
+    def set_data(self, data):
+        self.beginResetModel()
+        self.root = Node(None, None, [data] if type(data) in CONTAINER_TYPES else [])
+        self.root.fetch()
+        self.unfiltered = None
+        self.dirty = set()
+        self.endResetModel()
+        self.structure_changed.emit()
+
+    def is_filtered(self):
+        return self.unfiltered is not None
+
+    def filter_paths(self, paths):
+        # Shows only the entries at paths and their ancestors, on nodes of
+        # their own: no other entry gets a row, and the rows of the whole
+        # document are kept for when the filter is cleared. Returns the nodes
+        # shown with children, to be expanded.
+        top = self.to_python()
+        if top is None:
+            return []
+        root = Node(None, None, [top])
+        root.children = [ShownNode(root, None, top, 0)]
+        shown, parents = {}, [root.children[0]]
+        for path in paths:
+            node = root.children[0]
+            for key in path:
+                child = shown.get((node, key))
+                if child is None:
+                    node.resolve()
+                    try:
+                        child = ShownNode(node, key if node.is_dict() else None, node.value[key], key)
+                    except (KeyError, IndexError, TypeError):
+                        # Changed since the paths were found
+                        break
+                    if node.children is None:
+                        node.children = []
+                        parents.append(node)
+                    child.row = len(node.children)
+                    node.children.append(child)
+                    shown[(node, key)] = child
+                node = child
+        self.beginResetModel()
+        if self.unfiltered is None:
+            self.unfiltered = self.root
+            self.filter_edited = False
+        self.root = root
+        self.endResetModel()
+        return parents
+
+    def clear_filter(self):
+        if self.unfiltered is None:
+            return
+        self.beginResetModel()
+        self.root, self.unfiltered = self.unfiltered, None
+        if self.filter_edited:
+            # Rows built before the edits may hold old values: built again
+            self.root = Node(None, None, [self.to_python()])
+            self.root.fetch()
+        self.endResetModel()
+
+    def shown_row(self, node, key, loose=False):
+        # Row of the entry at key among the few shown by a filter, or None
+        keys = [key]
+        if loose and type(key) == str:
+            keys.append(get_elem_from_text(key))
+        if node.is_list():
+            keys += [k + len(node.value) for k in keys if loose and type(k) == int and k < 0]
+        for child in node.children:
+            if child.position() in keys:
+                return child.row
+        return None
+
+    def resolve(self, node):
+        if type(node.value) == codecs.LazyContainer:
+            node.resolve()
+            # Newly decoded entries, to be searched too
+            self.structure_changed.emit()
+
+    def to_python(self):
+        return self.root.value[0] if self.root.value else None
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def is_top(self, node):
+        return node.parent is self.root
+
+    def is_attached(self, node):
+        while node is not self.root:
+            if node.parent is None or node.parent.children is None:
+                return False
+            try:
+                node.get_row()
+            except ValueError:
+                return False
+            node = node.parent
+        return True
+
+    def find_path(self, path, rows=None, loose=False):
+        # rows caches the key -> row maps of the dicts walked so far. Loose
+        # paths, typed by hand, may give list positions and keys as text and
+        # count positions from the end when negative.
+        index = self.index(0, 0)
+        for key in path:
+            node = self.node(index)
+            self.resolve(node)
+            if node.children and type(node.children[0]) == ShownNode:
+                # Filtered: only the entries shown have rows
+                row = self.shown_row(node, key, loose)
+                if row is None:
+                    return QtCore.QModelIndex()
+                index = self.index(row, 0, index)
+                continue
+            row = None
+            if node.is_dict():
+                rows = rows if rows is not None else {}
+                if node not in rows:
+                    rows[node] = {k: i for i, k in enumerate(node.value)}
+                row = rows[node].get(key)
+                if row is None and loose and type(key) == str:
+                    row = rows[node].get(get_elem_from_text(key))
+            elif node.is_list() and loose and type(key) == str and key.lstrip("-").isdigit():
+                key = int(key)
+            if node.is_list() and loose and type(key) == int and key < 0:
+                key += len(node.value)
+            if node.is_list() and type(key) == int and 0 <= key < len(node.value):
+                row = key
+                if node.is_grouped():
+                    self.fetch_all(index)
+                    group = bisect.bisect_right([child.start for child in node.children], key) - 1
+                    index = self.index(group, 0, index)
+                    row = key - node.children[group].start
+            if row is None:
+                return QtCore.QModelIndex()
+            self.fetch_to(index, row)
+            index = self.index(row, 0, index)
+        return index
+
+    def get_path(self, node):
+        path = []
+        while not self.is_top(node):
+            if not node.is_group():
+                path.append(node.position())
+            node = node.parent
+        return tuple(reversed(path))
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        children = self.node(parent).children
+        if children is None or row < 0 or row >= len(children) or column < 0 or column > 1:
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is self.root:
+            return QtCore.QModelIndex()
+        return self.createIndex(parent.get_row(), 0, parent)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        children = self.node(parent).children
+        return len(children) if children is not None else 0
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 2
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        return parent.column() <= 0 and self.node(parent).total_rows() > 0
+
+    def canFetchMore(self, parent):
+        return parent.column() <= 0 and self.node(parent).can_fetch()
+
+    def fetchMore(self, parent, count=None):
+        # Rows are built FETCH_BATCH at a time as the view scrolls to them
+        node = self.node(parent)
+        if not self.canFetchMore(parent):
+            return
+        self.resolve(node)
+        start = len(node.children) if node.children is not None else 0
+        count = min(count or self.FETCH_BATCH, node.total_rows() - start)
+        if node.is_grouped():
+            count = node.total_rows()
+        if count == 0:
+            node.fetch(0)
+            return
+        self.beginInsertRows(parent, start, start + count - 1)
+        node.fetch(count)
+        self.endInsertRows()
+
+    def fetch_to(self, parent, row):
+        node = self.node(parent)
+        fetched = len(node.children) if node.children is not None else 0
+        if row >= fetched:
+            self.fetchMore(parent, row + 1 - fetched)
+
+    def fetch_all(self, parent):
+        node = self.node(parent)
+        self.resolve(node)
+        if node.can_fetch():
+            self.fetchMore(parent, node.total_rows())
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return ["Key", "Value"][section]
+        return None
+
+    def get_text(self, node, column):
+        if column == 0:
+            if self.is_top(node):
+                return self.container_text[node.value_type()]
+            elif node.is_group():
+                return "[" + str(node.start) + ".." + str(node.start + node.count - 1) + "]"
+            elif not node.parent.is_dict():
+                return "[" + str(node.position()) + "]"
+            return str(node.key)
+        elif self.is_top(node) or node.is_group():
+            return ""
+        text = self.container_text.get(node.value_type())
+        return text if text is not None else str(node.value)
+
+    def get_color(self, node, column):
+        if node.is_group():
+            return self.color_list
+        elif column == 0 and not self.is_top(node):
+            if not node.parent.is_dict():
+                return QtCore.Qt.black
+            return self.get_type_color(type(node.key))
+        return self.get_type_color(node.value_type())
+
+    def get_type_color(self, check_type):
+        name = self.type_colors.get(check_type)
+        return getattr(self, name) if name is not None else QtCore.Qt.darkMagenta
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role in [QtCore.Qt.DisplayRole, QtCore.Qt.EditRole]:
+            return self.get_text(node, index.column())
+        return None
+
+    def is_editable(self, node, column):
+        if self.locked or self.is_top(node) or node.is_group():
+            return False
+        elif column == 0:
+            return node.parent.is_dict()
+        return type(node.value) not in CONTAINER_TYPES
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        flags = QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+        if self.is_editable(index.internalPointer(), index.column()):
+            flags |= QtCore.Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if role != QtCore.Qt.EditRole or not index.isValid() or self.locked:
+            return False
+        node = index.internalPointer()
+        parent = node.parent
+        path, key, old = self.get_path(node), node.key, node.value
+        if index.column() == 0:
+            elem = get_elem_from_text(value, node.key)
+            if elem is node.key:
+                return True
+            if elem in parent.value:
+                return False
+            # The dict is rebuilt, so no lazy iterator may be left over it
+            self.fetch_all(index.parent())
+            # Rename in place, keeping the key order of the document
+            items = [(elem if k == node.key else k, v) for k, v in parent.value.items()]
+            parent.value.clear()
+            parent.value.update(items)
+            node.key = elem
+            self.dirty.add(self.get_path(parent))
         else:
-            super().setText(column, atext)
-
-    def apply_color(self):
-        pass
-
-    def set_color(self, check_type, column=1):
-        if check_type == str:
-            self.setForeground(column, self.color_string)
-        elif check_type == int:
-            self.setForeground(column, self.color_int)
-        elif check_type == float:
-            self.setForeground(column, self.color_float)
+            elem = get_elem_from_text(value, node.value)
+            if elem is node.value:
+                return True
+            owner = node.owner()
+            if type(owner.value) == array.array and not codecs.fits_array(owner.value, elem):
+                self.unpack_array(owner)
+            node.value = elem
+            owner.value[node.position()] = elem
+            self.dirty.add(self.get_path(node))
+        self.filter_edited = self.filter_edited or self.is_filtered()
+        self.dataChanged.emit(index, index)
+        self.entry_edited.emit(path, key, old, node.key, node.value)
+        return True
+
+    def unpack_array(self, node):
+        # Turns an array back into a list, for values the array cannot hold
+        values = node.value.tolist()
+        node.owner().value[node.position()] = values
+        node.value = values
+
+    def add_entry(self, index):
+        # Entries are only added and removed with every row shown
+        if self.locked or self.is_filtered():
+            return
+        node = self.node(index)
+        self.fetch_all(index)
+        key = None
+        if node.is_dict():
+            key, i = "new_key", 1
+            while key in node.value:
+                key, i = "new_key_" + str(i), i + 1
+        self.append_entry(index, key, "new_value")
+
+    def append_entry(self, index, key, value):
+        # Adds value at the end of the dict (under key) or list at index
+        node = self.node(index)
+        self.fetch_all(index)
+        if type(node.value) == array.array and not codecs.fits_array(node.value, value):
+            self.unpack_array(node)
+        if node.is_grouped():
+            # Appended to the last group, or to a new one once that is full
+            last = node.children[-1]
+            if last.count >= GROUP_SIZE:
+                self.beginInsertRows(index, len(node.children), len(node.children))
+                group = GroupNode(node, len(node.value), 1)
+                group.row = len(node.children)
+                node.children.append(group)
+                node.value.append(value)
+                self.endInsertRows()
+            else:
+                group_index = self.index(last.row, 0, index)
+                self.fetch_all(group_index)
+                self.beginInsertRows(group_index, last.count, last.count)
+                new_node = Node(last, None, value)
+                new_node.row = last.count
+                last.children.append(new_node)
+                last.count += 1
+                node.value.append(new_node.value)
+                self.endInsertRows()
+            self.dirty.add(self.get_path(node))
+            self.structure_changed.emit()
+            return
+        children = node.children
+        new_node = Node(node, key if node.is_dict() else None, value)
+        new_node.row = len(children)
+        self.beginInsertRows(index, len(children), len(children))
+        children.append(new_node)
+        if node.is_dict():
+            node.value[new_node.key] = new_node.value
         else:
-            self.setForeground(column, QtCore.Qt.darkMagenta)
-
+            node.value.append(new_node.value)
+        self.endInsertRows()
+        self.dirty.add(self.get_path(node))
+        self.structure_changed.emit()
+
+    def update_data(self, data):
+        # Brings the document to data changing only the rows that differ,
+        # which keeps the view's expansion, selection and scroll position
+        if not self.root.get_children() or type(data) not in CONTAINER_TYPES:
+            # Anything but a dict or list, e.g. None from a file being rewritten, shows as empty
+            self.set_data(data)
+            return
+        self.update_node(self.root.children[0], data)
+        self.dirty = set()
+        self.structure_changed.emit()
+
+    def update_node(self, node, value):
+        # Walks old and new together, changing the rows of what differs. Rows
+        # not built yet are not built for it: their entries change in place.
+        old = node.value
+        if not diff.comparable(old, value):
+            self.replace_value(node, value)
+            return
+        elif old == value and diff.same(old, value):
+            return
+        index = self.index_of(node)
+        built = node.children is not None and not node.is_grouped()
+        if type(old) == dict:
+            changes = diff.dict_changes(old, value)
+            if changes is None:
+                # Reordered keys
+                self.replace_value(node, value)
+                return
+            removed, kept, added = changes
+            children = {child.key: child for child in node.children} if built else {}
+            if removed:
+                for key in removed:
+                    if key not in children:
+                        del old[key]
+                self.remove_row_runs(index, [children[key].get_row() for key in removed if key in children])
+            for key in kept:
+                self.update_entry(node, children.get(key), key, value[key])
+            for key in added:
+                if built and node.pending is None:
+                    self.append_entry(index, key, value[key])
+                else:
+                    old[key] = value[key]
+        elif type(old) in LIST_TYPES:
+            common = min(len(old), len(value))
+            if len(old) != len(value) and (node.is_grouped() or len(value) > GROUP_SIZE):
+                self.replace_value(node, value)
+                return
+            for i in range(common):
+                if old[i] != value[i] or not diff.same(old[i], value[i]):
+                    self.update_entry(node, self.find_child(node, i), i, value[i])
+            if len(old) > common:
+                if built and len(node.children) > common:
+                    self.remove_rows(index, common, len(node.children) - 1)
+                del old[common:]
+            for i in range(common, len(value)):
+                if built and node.pending is None:
+                    self.append_entry(index, None, value[i])
+                else:
+                    old.append(value[i])
+        else:
+            self.replace_value(node, value)
+            return
+        if node.children is not None:
+            node.restart()
+        # Shows or hides the expand mark of containers without rows
+        self.dataChanged.emit(index, index.siblingAtColumn(1))
+
+    def update_entry(self, owner, node, key, value):
+        # node is None for entries whose row has not been built yet
+        if node is not None:
+            self.update_node(node, value)
+        else:
+            owner.value[key] = value
+
+    def find_child(self, node, position):
+        # The built node of the list entry at position, if any
+        if not node.children:
+            return None
+        elif node.is_grouped():
+            group = node.children[bisect.bisect_right([child.start for child in node.children], position) - 1]
+            position -= group.start
+            node = group
+        return node.children[position] if node.children is not None and position < len(node.children) else None
+
+    def replace_value(self, node, value):
+        index = self.index_of(node)
+        fetched = bool(node.children)
+        if fetched:
+            self.beginRemoveRows(index, 0, len(node.children) - 1)
+            node.children, node.pending = None, None
+            self.endRemoveRows()
+        node.children, node.pending = None, None
+        node.value = value
+        node.owner().value[node.position()] = value
+        self.dataChanged.emit(index, index.siblingAtColumn(1))
+        self.structure_changed.emit()
+        if fetched:
+            # Shown again, as the view only fetches on expanding
+            self.fetchMore(index)
+
+    def index_of(self, node):
+        if node is self.root:
+            return QtCore.QModelIndex()
+        return self.createIndex(node.get_row(), 0, node)
+
+    def remove_entry(self, index):
+        self.remove_entries([index])
+
+    def remove_entries(self, indexes):
+        if self.locked or self.is_filtered():
+            return
+        nodes = {self.node(index) for index in indexes if index.isValid()}
+        by_parent = {}
+        for node in nodes:
+            if self.is_top(node) or node.is_group():
+                continue
+            # Entries inside another removed entry go with it
+            ancestor = node.parent
+            while ancestor is not None and ancestor not in nodes:
+                ancestor = ancestor.parent
+            if ancestor is None:
+                by_parent.setdefault(node.parent, []).append(node)
+        for parent, children in by_parent.items():
+            parent_index = self.index_of(parent)
+            self.fetch_all(parent_index)
+            self.remove_row_runs(parent_index, [child.get_row() for child in children])
+
+    def remove_row_runs(self, parent_index, rows):
+        # Contiguous runs go in one call each, the last first so the rows
+        # still to remove keep their numbers
+        runs = []
+        for row in sorted(rows):
+            if runs and runs[-1][1] == row - 1:
+                runs[-1][1] = row
+            else:
+                runs.append([row, row])
+        for first, last in reversed(runs):
+            self.remove_rows(parent_index, first, last)
+
+    def remove_rows(self, parent_index, first, last):
+        parent = self.node(parent_index)
+        owner = parent.parent if parent.is_group() else parent
+        count = last - first + 1
+        self.beginRemoveRows(parent_index, first, last)
+        removed = parent.children[first:last + 1]
+        del parent.children[first:last + 1]
+        if owner.is_dict():
+            for child in removed:
+                del owner.value[child.key]
+        else:
+            start = parent.start + first if parent.is_group() else first
+            del owner.value[start:start + count]
+        if parent.is_group():
+            # Only the ranges of the groups after this one move
+            parent.count -= count
+            for group in owner.children[parent.get_row() + 1:]:
+                group.start -= count
+        self.endRemoveRows()
+        self.dirty.add(self.get_path(owner))
+        self.structure_changed.emit()
+        if not parent.is_dict() and first < len(parent.children):
+            # The following entries show their new index
+            self.dataChanged.emit(self.index(first, 0, parent_index), self.index(len(parent.children) - 1, 0, parent_index))
+        if parent.is_group():
+            owner_index = parent_index.parent()
+            group_row = parent.get_row()
+            if parent.count == 0:
+                self.beginRemoveRows(owner_index, group_row, group_row)
+                del owner.children[group_row]
+                self.endRemoveRows()
+            elif group_row + 1 < len(owner.children):
+                self.dataChanged.emit(self.index(group_row + 1, 0, owner_index), self.index(len(owner.children) - 1, 0, owner_index))
+
+
+class DictItemDelegate(QStyledItemDelegate):
+    # Paints the colours of the model and refuses editors for read-only
+    # cells, so no row needs a widget of its own
+
+    def initStyleOption(self, option, index):
+        super().initStyleOption(option, index)
+        if not index.isValid():
+            return
+        option.palette.setColor(QtGui.QPalette.Text, QtGui.QColor(index.model().get_color(index.internalPointer(), index.column())))
 
-class DictRoot(Item):
-    def __init__(self, parent):
-        super().__init__(parent, ["{dict}"])
-        self.setForeground(0, self.color_dict)
-        self.readonly([0])
+    def createEditor(self, parent, option, index):
+        if not index.flags() & QtCore.Qt.ItemIsEditable:
+            return None
+        return super().createEditor(parent, option, index)
 
 
-class ListRoot(Item):
-    def __init__(self, parent):
-        super().__init__(parent, ["[list]"])
-        self.setForeground(0, self.color_list)
-        self.readonly([0])
+class DictTreeWidget(QTreeView):
+    EXPAND_BATCH = 200
 
+    def __init__(self):
+        super().__init__()
+        font = QFont("Courier New", 12)  # Create a QFont object specifying the monospace font family and size
+        self.setFont(font)
+        # Keep a reference: the view does not take ownership of the model
+        self.dict_model = DictModel()
+        self.setModel(self.dict_model)
+        self.setItemDelegate(DictItemDelegate(self))
+        # All rows are one line high: lets the view skip measuring each row
+        self.setUniformRowHeights(True)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.expanded_nodes = set()
+        self.expanded.connect(self.node_expanded)
+        self.collapsed.connect(self.node_collapsed)
+        self.dict_model.modelReset.connect(self.expanded_nodes.clear)
+        # Column widths follow the rows on screen, measured once things settle
+        self.fixed_widths = False
+        self.shrink_columns = False
+        self.header().setResizeContentsPrecision(0)
+        self.resize_timer = QtCore.QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(100)
+        self.resize_timer.timeout.connect(self.resize_visible_columns)
+        self.expanded.connect(lambda index: self.resize_column())
+        self.verticalScrollBar().valueChanged.connect(lambda value: self.resize_column())
+        # Breadth-first expansion job, run a batch per event-loop tick
+        self.expand_budget = 10000
+        self.expand_queue = collections.deque()
+        self.expand_depth = None
+        self.expand_count = 0
+        self.expand_timer = QtCore.QTimer(self)
+        self.expand_timer.timeout.connect(self.expand_step)
+        self.dict_model.modelReset.connect(self.stop_expanding)
+        self.dict_model.rowsRemoved.connect(self.stop_expanding)
+        # Expanded paths of the whole document, while a filter shows only some rows
+        self.unfiltered_paths = None
+        # self.header().setSectionResizeMode(0, QHeaderView.ResizeToContents)
 
-class DictEntryDict(Item):
-    def __init__(self, parent, key):
-        super().__init__(parent, [str(key), "{dict}"])
-        self.setForeground(1, self.color_dict)
-        self.readonly([1])
-        self.apply_color()
+    def resize_column(self, shrink=False):
+        self.shrink_columns = self.shrink_columns or shrink
+        if not self.fixed_widths:
+            self.resize_timer.start()
+
+    def resize_visible_columns(self):
+        # Only grows the columns unless asked, so scrolling does not make them jump
+        for column in [0, 1]:
+            width = self.sizeHintForColumn(column)
+            if not self.shrink_columns:
+                width = max(width, self.columnWidth(column))
+            self.setColumnWidth(column, width)
+        self.shrink_columns = False
+
+    def expand_subtree(self, index, depth=None):
+        # Expands index and the containers below it, down to depth levels
+        self.expand_queue = collections.deque([(index, 0)])
+        self.expand_depth = depth
+        self.expand_count = 0
+        self.expand_timer.start()
+
+    def stop_expanding(self):
+        self.expand_queue.clear()
+        self.expand_timer.stop()
+
+    def expand_step(self):
+        model = self.model()
+        # With a relayout pending, setExpanded() only records the index
+        self.scheduleDelayedItemsLayout()
+        for _ in range(self.EXPAND_BATCH):
+            if not self.expand_queue or self.expand_count >= self.expand_budget:
+                self.stop_expanding()
+                self.resize_column()
+                return
+            index, level = self.expand_queue.popleft()
+            if not model.hasChildren(index) or (self.expand_depth is not None and level >= self.expand_depth):
+                continue
+            self.setExpanded(index, True)
+            self.expand_count += 1
+            # As many rows as the budget could still expand, not just a fetch batch
+            model.fetch_to(index, self.expand_budget - self.expand_count - 1)
+            for row in range(model.rowCount(index)):
+                self.expand_queue.append((model.index(row, 0, index), level + 1))
+
+    def node_expanded(self, index):
+        self.expanded_nodes.add(self.model().node(index))
+
+    def node_collapsed(self, index):
+        self.expanded_nodes.discard(self.model().node(index))
+
+    def filter_paths(self, paths):
+        # Shows only the rows of paths and of their ancestors
+        model = self.model()
+        if not model.is_filtered():
+            self.unfiltered_paths = self.expanded_paths()
+        parents = model.filter_paths(paths)
+        self.scheduleDelayedItemsLayout()
+        for node in parents:
+            self.setExpanded(model.index_of(node), True)
+
+    def clear_filter(self):
+        # Back to every row, expanded as before filtering
+        model = self.model()
+        if not model.is_filtered():
+            return
+        model.clear_filter()
+        self.expand_paths(self.unfiltered_paths)
+        self.unfiltered_paths = None
+
+    def expanded_paths(self):
+        model = self.model()
+        if model.is_filtered():
+            return self.unfiltered_paths
+        return {model.get_path(node) for node in self.expanded_nodes if not node.is_group() and model.is_attached(node)}
+
+    def expand_paths(self, paths):
+        model = self.model()
+        rows = {}
+        self.scheduleDelayedItemsLayout()
+        for path in sorted(paths, key=len):
+            index = model.find_path(path, rows)
+            if index.isValid():
+                self.setExpanded(index, True)
 
-    def apply_color(self):
-        self.set_color(self.key_type, 0)
+    def contextMenuEvent(self, a0: QtGui.QContextMenuEvent) -> None:
+        super().contextMenuEvent(a0)
+        index = self.indexAt(a0.pos()).siblingAtColumn(0)
+        if not index.isValid():
+            return
+        model = self.model()
+        node = model.node(index)
+        selected = self.selectionModel().selectedRows(0)
+        if index not in selected:
+            selected = [index]
 
+        menu = QMenu()
+        editable = not model.locked and not model.is_filtered()
+        del_entry = menu.addAction("Delete") if editable and not model.is_top(node) and not node.is_group() else None
 
-class DictEntryList(Item):
-    def __init__(self, parent, key):
-        super().__init__(parent, [str(key), "[list]"])
-        self.setForeground(1, self.color_list)
-        self.readonly([1])
-        self.apply_color()
+        add_dict_entry, add_list_entry, expand_subtree = None, None, None
 
-    def apply_color(self):
-        self.set_color(self.key_type, 0)
+        if not editable:
+            pass
+        elif node.is_dict():
+            add_dict_entry = menu.addAction("Add Dict Entry")
 
+        elif node.is_list():
+            add_list_entry = menu.addAction("Add List Entry")
 
-class DictEntryValue(Item):
-    def __init__(self, parent, key, value):
-        super().__init__(parent, [str(key), str(value)])
-        self.apply_color()
+        if model.hasChildren(index):
+            expand_subtree = menu.addAction("Expand Subtree")
 
-    def apply_color(self):
-        self.set_color(self.key_type, 0)
-        self.set_color(self.value_type, 1)
+        res = menu.exec(a0.globalPos())
+        if res is None:
+            pass
+        elif res == expand_subtree:
+            self.expand_subtree(index)
+        elif res == add_dict_entry or res == add_list_entry:
+            model.add_entry(index)
+        elif res == del_entry:
+            model.remove_entries(selected)
 
 
-class ListEntry(Item):
+class LoadCancelled(Exception):
     pass
 
 
-class ListEntryList(ListEntry):
-    def __init__(self, parent, key):
-        super().__init__(parent, ["[" + str(key) + "]", "[list]"])
-        self.setForeground(0, QtCore.Qt.black)
-        self.readonly([0, 1])
-        self.apply_color()
+class LoadSignals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int)
+    loaded = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str)
 
-    def apply_color(self):
-        self.set_color(self.value_type, 1)
 
+class LoadWorker(QtCore.QRunnable):
+    # Parses a file on the thread pool; progress is in thousandths of the file size
 
-class ListEntryValue(ListEntry):
-    def __init__(self, parent, key, value):
-        super().__init__(parent, ["[" + str(key) + "]", str(value)])
-        self.setForeground(0, QtCore.Qt.black)
-        self.readonly([0])
-        self.apply_color()
+    def __init__(self, filename, use_libyaml, mapped=False):
+        super().__init__()
+        self.filename = filename
+        self.use_libyaml = use_libyaml
+        self.size = max(os.path.getsize(filename), 1)
+        self.mapped = mapped and filename.endswith(".json") and self.size >= codecs.MAPPED_MIN_SIZE
+        stat = os.stat(filename)
+        self.stat = stat.st_size, stat.st_mtime_ns
+        self.cancelled = False
+        self.signals = LoadSignals()
+
+    def report(self, count):
+        if self.cancelled:
+            raise LoadCancelled()
+        self.signals.progress.emit(count * 1000 // self.size)
+
+    def run(self):
+        try:
+            data = codecs.read_document(self.filename, self.use_libyaml, self.report, self.mapped)
+        except LoadCancelled:
+            return
+        except Exception as e:
+            if not self.cancelled:
+                self.signals.failed.emit(str(e))
+            return
+        if not self.cancelled:
+            self.signals.loaded.emit(data)
 
-    def apply_color(self):
-        self.set_color(self.value_type, 1)
 
+class SaveSignals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int)
+    saved = QtCore.pyqtSignal()
+    failed = QtCore.pyqtSignal(str)
 
-class ListEntryDict(ListEntry):
-    def __init__(self, parent, key):
-        super().__init__(parent, ["[" + str(key) + "]", "{dict}"])
-        self.setForeground(0, QtCore.Qt.black)
-        self.setForeground(1, QtCore.Qt.red)
-        self.readonly([0, 1])
 
+class SaveWorker(QtCore.QRunnable):
+    # Writes the document on the thread pool; progress is in bytes written.
+    # With paths given, these edits are patched into the file if possible.
 
-class DictTreeWidget(QTreeWidget):
-    def __init__(self):
+    def __init__(self, filename, data, paths, use_libyaml, compact_json, mapped):
         super().__init__()
-        font = QFont("Courier New", 12)  # Create a QFont object specifying the monospace font family and size
-        self.setFont(font)
-        self.itemExpanded.connect(self.resize_column)
-        self.setColumnCount(2)
-        # self.header().setSectionResizeMode(0, QHeaderView.ResizeToContents)
+        self.filename = filename
+        self.data = data
+        self.paths = paths
+        self.use_libyaml = use_libyaml
+        self.compact_json = compact_json
+        self.mapped = mapped
+        self.signals = SaveSignals()
+
+    def report(self, count):
+        self.signals.progress.emit(count)
+
+    def run(self):
+        try:
+            codecs.write_document(self.filename, self.data, self.paths, self.use_libyaml, self.compact_json, self.mapped, self.report)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.saved.emit()
 
-    def resize_column(self):
-        self.resizeColumnToContents(0)
-        self.resizeColumnToContents(1)
 
-    def contextMenuEvent(self, a0: QtGui.QContextMenuEvent) -> None:
-        super().contextMenuEvent(a0)
-        index = self.indexAt(a0.pos())
-        item = self.itemFromIndex(index)
+class IndexSignals(QtCore.QObject):
+    built = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str)
 
-        menu = QMenu()
-        del_entry = menu.addAction("Delete")
 
-        add_dict_entry, add_list_entry = None, None
+class IndexWorker(QtCore.QRunnable):
+    # Builds the search index of a document on the thread pool
 
-        if type(item) in [ListEntryDict, DictEntryDict, DictRoot]:
-            add_dict_entry = menu.addAction("Add Dict Entry")
+    def __init__(self, data):
+        super().__init__()
+        self.data = data
+        self.cancelled = False
+        # Set for edits made while building, which the index may have missed
+        self.edited = False
+        self.signals = IndexSignals()
 
-        elif type(item) in [ListEntryList, DictEntryList, ListRoot]:
-            add_list_entry = menu.addAction("Add List Entry")
+    def report(self, count):
+        if self.cancelled:
+            raise LoadCancelled()
 
-        res = menu.exec(a0.globalPos())
-        if res is None:
-            pass
-        elif res == add_dict_entry:
-            new_item = DictEntryValue(item, "new_key", "new_value")
-            item.addChild(new_item)
-        elif res == del_entry:
-            parent = item.parent()
-            parent.removeChild(item)
-            if isinstance(item, ListEntry):
-                for i in range(parent.childCount()):
-                    list_item = parent.child(i)
-                    list_item.setText(0, "[" + str(i) + "]")
-            del item
-
-        elif res == add_list_entry:
-            # parent = item.parent()
-            new_item = ListEntryValue(item, item.childCount(), "new_value")
-            item.addChild(new_item)
-
-    def populate_tree(self, value, parent=None, key=None):
-        if parent is None:
-            if type(value) == dict:
-                parent = DictRoot(self.invisibleRootItem())
-                self.addTopLevelItem(parent)
-                self.invisibleRootItem().addChild(parent)
-                for key, value in value.items():
-                    self.populate_tree(value, parent, key)
-            elif type(value) == list:
-                parent = ListRoot(self.invisibleRootItem())
-                self.addTopLevelItem(parent)
-                self.invisibleRootItem().addChild(parent)
-                for i, elem in enumerate(value):
-                    self.populate_tree(elem, parent, i)
+    def run(self):
+        try:
+            index = search.SearchIndex().build(self.data, self.report)
+        except LoadCancelled:
             return
-        elif type(parent) in [ListRoot, DictEntryList, ListEntryList]:
-            if type(value) == dict:
-                item = ListEntryDict(parent, key)
-                for key, value in value.items():
-                    self.populate_tree(value, item, key)
-                parent.addChild(item)
-            elif type(value) == list:
-                item = ListEntryList(parent, key)
-                for i, elem in enumerate(value):
-                    self.populate_tree(elem, item, i)
-                parent.addChild(item)
-            else:
-                item = ListEntryValue(parent, key, value)
-                parent.addChild(item)
-        elif type(parent) in [DictRoot, DictEntryDict, ListEntryDict]:
-            if type(value) == dict:
-                item = DictEntryDict(parent, key)
-                for key, value in value.items():
-                    self.populate_tree(value, item, key)
-                parent.addChild(item)
-            elif type(value) == list:
-                item = DictEntryList(parent, key)
-                for i, elem in enumerate(value):
-                    self.populate_tree(elem, item, i)
-                parent.addChild(item)
-            else:
-                item = DictEntryValue(parent, key, value)
-                parent.addChild(item)
-
-    def traverse_tree(self, item, output=None):
-        if type(item) == DictRoot:
-            output = {}
-            for i in range(item.childCount()):
-                self.traverse_tree(item.child(i), output)
-        elif type(item) == ListRoot:
-            output = []
-            for i in range(item.childCount()):
-                self.traverse_tree(item.child(i), output)
-        elif type(item) == DictEntryValue:
-            output[item.get_key()] = item.get_value()
-        elif type(item) == DictEntryList:
-            output[item.get_key()] = []
-            for i in range(item.childCount()):
-                self.traverse_tree(item.child(i), output[item.get_key()])
-        elif type(item) == DictEntryDict:
-            output[item.get_key()] = {}
-            for i in range(item.childCount()):
-                self.traverse_tree(item.child(i), output[item.get_key()])
-        elif type(item) == ListEntryValue:
-            output.append(item.get_value())
-        elif type(item) == ListEntryList:
-            output.append([])
-            for i in range(item.childCount()):
-                self.traverse_tree(item.child(i), output[-1])
-        elif type(item) == ListEntryDict:
-            output.append({})
-            for i in range(item.childCount()):
-                self.traverse_tree(item.child(i), output[-1])
-
-        return output
-
-    def traverse_tree_2(self, item, output=None):
-        if output is None:
-            output = {} if isinstance(item, DictRoot) else []  # Initialize output if not provided
-
-        if isinstance(item, (DictRoot, ListRoot)):
-            for i in range(item.childCount()):
-                self.traverse_tree_2(item.child(i), output)
-        elif isinstance(item, (DictEntryValue, ListEntryValue)):
-            if isinstance(item, DictEntryValue):
-                output[item.get_key()] = item.get_value()
-            else:
-                output.append(item.get_value())
-        elif isinstance(item, (DictEntryList, ListEntryList)):
-            sub_output = []
-            for i in range(item.childCount()):
-                self.traverse_tree_2(item.child(i), sub_output)
-            if isinstance(item, DictEntryList):
-                output[item.get_key()] = sub_output
-            else:
-                output.append(sub_output)
-        elif isinstance(item, (DictEntryDict, ListEntryDict)):
-            sub_output = {}
-            for i in range(item.childCount()):
-                self.traverse_tree_2(item.child(i), sub_output)
-            if isinstance(item, DictEntryDict):
-                output[item.get_key()] = sub_output
-            else:
-                output.append(sub_output)
-
-        return output
+        except RuntimeError as e:
+            # The document changed size under the build
+            self.signals.failed.emit(str(e))
+            return
+        if not self.cancelled:
+            self.signals.built.emit(index)
 
 
 class DictEditorWindow(QMainWindow):
     colors = ["black", "red", "green", "blue", "cyan", "magenta", "yellow", "gray"]
+    budgets = ["1000", "10000", "100000", "1000000"]
+    # Filtering beyond this many matches would show most of the tree anyway
+    FILTER_LIMIT = 5000
     qcolors = [Qt.black, Qt.red, Qt.darkGreen, Qt.blue, Qt.cyan, Qt.magenta, Qt.yellow, Qt.gray]
 
     def __init__(self):
@@ -335,6 +885,13 @@ class DictEditorWindow(QMainWindow):
         self.config = EasyConfig()
         general = self.config.root().addSubSection("General")
         open_last = general.addCheckbox("open_last", pretty="Open last file", default=True)
+        self.json_compact = general.addCheckbox("json_compact", pretty="Compact JSON output (" + codecs.json_backend() + ")", default=False)
+        self.expand_budget = general.addCombobox("expand_budget", pretty="Expand node budget", items=self.budgets, default=1)
+        self.fixed_widths = general.addCheckbox("fixed_widths", pretty="Fixed column widths", default=False)
+        self.libyaml = general.addCheckbox("libyaml", pretty="Use libyaml (" + ("available" if codecs.LIBYAML else "not installed") + ")", default=True)
+        self.write_back = general.addCheckbox("write_back", pretty="Save edits in place, keeping the file's formatting (slower than a full rewrite)", default=False)
+        self.auto_refresh = general.addCheckbox("auto_refresh", pretty="Refresh when the file changes on disk", default=False)
+        self.mapped_json = general.addCheckbox("mapped_json", pretty="Map large JSON files, decoding on expand", default=True)
 
         colors = self.config.root().addSubSection("Colors")
         self.color_string = colors.addCombobox("string", pretty="String", items=self.colors, default=3)
@@ -344,9 +901,10 @@ class DictEditorWindow(QMainWindow):
         self.color_list = colors.addCombobox("list", pretty="List", items=self.colors, default=5)
         private = self.config.root().addHidden("private")
         self.filename = private.addString("filename")
-        self.expanded = private.addString("expanded")
         self.pose = private.addList("pose")
         self.config.load(self.config_file)
+        self.expansion = ExpansionStore(config_dir + os.sep + "expanded.json")
+        self.expansion.load()
 
         self.update_colors()
 
@@ -360,7 +918,15 @@ class DictEditorWindow(QMainWindow):
         file.addAction("Save", self.save)
         file.addAction("Save as", self.save_as)
         edit = self.menuBar().addMenu("Edit")
+        edit.addAction("Find", self.focus_search, "Ctrl+F")
+        edit.addAction("Find next", self.next_match, "F3")
+        edit.addAction("Go to path", self.focus_path, "Ctrl+L")
         edit.addAction("Preferences", self.edit_preferences)
+        view = self.menuBar().addMenu("View")
+        for depth in range(1, 6):
+            view.addAction("Expand to depth {}".format(depth), lambda depth=depth: self.expand_to_depth(depth))
+        view.addAction("Expand all", self.expand_all)
+        view.addAction("Collapse all", self.collapse_all)
 
         tb = self.addToolBar("File")
         tb.addAction(QIcon(":/icons/open.png"), "Open", self.open_file)
@@ -369,14 +935,79 @@ class DictEditorWindow(QMainWindow):
         tb.addAction(QIcon(":/icons/expand.png"), "Expand all", self.expand_all)
         tb.addSeparator()
         tb.addAction(QIcon(":/icons/refresh.png"), "Refresh", self.refresh)
+        tb.addSeparator()
+        self.path_edit = QLineEdit()
+        self.path_edit.setPlaceholderText("Go to path, e.g. spec.containers[3].env")
+        self.path_edit.setClearButtonEnabled(True)
+        self.path_edit.setMaximumWidth(300)
+        self.path_edit.returnPressed.connect(self.go_to_path)
+        tb.addWidget(self.path_edit)
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Search keys and values")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.setMaximumWidth(300)
+        self.search_edit.textChanged.connect(self.search)
+        self.search_edit.returnPressed.connect(self.next_match)
+        tb.addWidget(self.search_edit)
+        self.filter_check = QCheckBox("Filter")
+        self.filter_check.toggled.connect(self.search)
+        tb.addWidget(self.filter_check)
 
         self.tree_widget = DictTreeWidget()
-        self.tree_widget.setHeaderLabels(["Key", "Value"])
+        self.tree_widget.fixed_widths = self.fixed_widths.get_value()
+        self.tree_widget.expand_budget = int(self.budgets[self.expand_budget.get_value()])
         helper = QWidget()
         layout = QVBoxLayout()
         layout.addWidget(self.tree_widget)
         helper.setLayout(layout)
         self.setCentralWidget(helper)
+
+        self.loader = None
+        self.saver = None
+        # Saves run on a pool of their own, so waiting for one does not also
+        # wait for a cancelled load still parsing on the global pool
+        self.save_pool = QtCore.QThreadPool(self)
+        self.save_pool.setMaxThreadCount(1)
+        self.reloader = None
+        # Writers often touch a file several times in a row: reload once they are done
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.file_changed)
+        self.reload_timer = QtCore.QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(500)
+        self.reload_timer.timeout.connect(self.reload_changed)
+        self.mapped = False
+        self.source_stat = None
+        self.progress = QProgressBar()
+        self.progress.setRange(0, 1000)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_load)
+        self.statusBar().addPermanentWidget(self.progress)
+        self.statusBar().addPermanentWidget(self.cancel_button)
+        self.show_progress(False)
+
+        # Rebuilt off-thread after the document changes, patched for edits in place
+        self.search_index = None
+        self.indexer = None
+        self.matches = []
+        self.match = -1
+        self.index_timer = QtCore.QTimer(self)
+        self.index_timer.setSingleShot(True)
+        self.index_timer.setInterval(300)
+        self.index_timer.timeout.connect(self.build_index)
+        self.filter_timer = QtCore.QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(300)
+        self.filter_timer.timeout.connect(self.apply_filter)
+        self.tree_widget.model().structure_changed.connect(self.index_timer.start)
+        self.tree_widget.model().entry_edited.connect(self.entry_edited)
+        # Paths gone to, and the key -> row maps of the dicts on the way
+        self.path_cache = {}
+        self.path_rows = {}
+        self.tree_widget.model().structure_changed.connect(self.clear_path_cache)
+        self.tree_widget.model().modelReset.connect(self.clear_path_cache)
+        self.tree_widget.selectionModel().currentChanged.connect(self.show_path)
+
         self.setWindowTitle("Dictionary Editor")
         self.show()
 
@@ -388,47 +1019,84 @@ class DictEditorWindow(QMainWindow):
 
         elif self.current_filename is not None and os.path.exists(self.current_filename) and open_last.get_value() is True:
             self.open_file(self.current_filename)
-            expanded = self.expanded.get_value()
-            if expanded is not None:
-                self.set_expanded_recursive([int(x) for x in expanded])
-
-        self.tree_widget.itemChanged.connect(self.item_changed)
 
     def expand_all(self):
-        self.tree_widget.expandAll()
-        self.tree_widget.resizeColumnToContents(0)
-        self.tree_widget.resizeColumnToContents(1)
+        self.expand_to_depth(None)
+
+    def expand_to_depth(self, depth):
+        self.tree_widget.expand_subtree(self.tree_widget.model().index(0, 0), depth)
+
+    def collapse_all(self):
+        self.tree_widget.stop_expanding()
+        self.tree_widget.collapseAll()
+        self.tree_widget.expanded_nodes.clear()
 
     def update_colors(self):
-        Item.color_int = self.qcolors[self.color_int.get_value()]
-        Item.color_float = self.qcolors[self.color_float.get_value()]
-        Item.color_string = self.qcolors[self.color_string.get_value()]
-        Item.color_dict = self.qcolors[self.color_dict.get_value()]
-        Item.color_list = self.qcolors[self.color_list.get_value()]
+        DictModel.color_int = self.qcolors[self.color_int.get_value()]
+        DictModel.color_float = self.qcolors[self.color_float.get_value()]
+        DictModel.color_string = self.qcolors[self.color_string.get_value()]
+        DictModel.color_dict = self.qcolors[self.color_dict.get_value()]
+        DictModel.color_list = self.qcolors[self.color_list.get_value()]
 
     def edit_preferences(self):
         if self.config.exec():
             self.config.save(self.config_file)
             self.update_colors()
-            expanded = self.get_expanded_recursive()
-            data = self.tree_widget.traverse_tree(self.tree_widget.invisibleRootItem().child(0))
-            self.populate(data)
-            self.set_expanded_recursive(expanded)
-
-    def item_changed(self, item, column):
-        item.update_type()
-        item.apply_color()
+            self.tree_widget.fixed_widths = self.fixed_widths.get_value()
+            self.tree_widget.expand_budget = int(self.budgets[self.expand_budget.get_value()])
+            # Colours are read at paint time: repainting the visible rows is enough
+            self.tree_widget.viewport().update()
+            self.watch_file()
 
     def save(self, filename=None):
+        model = self.tree_widget.model()
+        if self.saver is not None or not filename and not model.dirty:
+            # Nothing edited since the file was loaded or last saved
+            return
+        # Edits can only be patched into the very file they were loaded from
+        unchanged = self.source_stat is not None and self.source_stat == self.file_stat(self.current_filename)
+        patch = self.write_back.get_value() and filename in [None, self.current_filename] and unchanged
         self.current_filename = filename if filename else self.current_filename
         if self.current_filename:
-            data = self.tree_widget.traverse_tree(self.tree_widget.invisibleRootItem().child(0))
-            with open(self.current_filename, "w") as f:
-                if self.current_filename.endswith(".json"):
-                    json.dump(data, f)
-                elif self.current_filename.endswith(".yaml"):
-                    yaml.dump(data, f)
-            self.setWindowTitle("Dictionary Editor - " + self.current_filename)
+            saver = SaveWorker(self.current_filename, model.to_python(), set(model.dirty) if patch else None, self.libyaml.get_value(),
+                               self.json_compact.get_value(), self.mapped)
+            saver.signals.progress.connect(self.show_saved)
+            saver.signals.saved.connect(lambda: self.file_saved(saver))
+            saver.signals.failed.connect(lambda message: self.save_failed(saver, message))
+            self.saver = saver
+            # The worker reads the document as it is: no edits until it is done
+            model.locked = True
+            self.progress.setRange(0, 0)
+            self.progress.setVisible(True)
+            self.statusBar().showMessage("Saving " + self.current_filename)
+            self.save_pool.start(saver)
+
+    def show_saved(self, count):
+        self.statusBar().showMessage("Saving {}: {:.1f} MB written".format(self.saver.filename, count / 2 ** 20))
+
+    def file_saved(self, saver):
+        self.finish_save()
+        self.source_stat = self.file_stat(saver.filename)
+        self.tree_widget.model().dirty = set()
+        self.watch_file()
+        self.setWindowTitle("Dictionary Editor - " + saver.filename)
+
+    def save_failed(self, saver, message):
+        self.finish_save()
+        self.show_error_message("Error saving {}: {}".format(saver.filename, message))
+
+    def finish_save(self):
+        self.saver = None
+        self.tree_widget.model().locked = False
+        self.progress.setRange(0, 1000)
+        self.progress.setVisible(False)
+        self.statusBar().clearMessage()
+
+    def file_stat(self, filename):
+        if not filename or not os.path.exists(filename):
+            return None
+        stat = os.stat(filename)
+        return stat.st_size, stat.st_mtime_ns
 
     def save_as(self):
         options = QFileDialog.Options()
@@ -447,7 +1115,7 @@ class DictEditorWindow(QMainWindow):
         msg.setWindowTitle("Error")
         msg.exec_()
 
-    def open_file(self, filename=None):
+    def open_file(self, filename=None, expanded=None):
         directory = None
         if filename is None:
             filename, _ = QFileDialog.getOpenFileName(self, "Open File", directory, "YAML or JSON Files (*.json *.yaml)")
@@ -457,66 +1125,244 @@ class DictEditorWindow(QMainWindow):
                 self.show_error_message("File does {} not exist".format(filename))
                 return
 
-            if filename.endswith(".json"):
-                with open(filename, "r") as f:
-                    data = json.load(f)
-            elif filename.endswith(".yaml"):
-                with open(filename, "r") as f:
-                    data = yaml.load(f, Loader=yaml.FullLoader)
-            else:
+            if not filename.endswith(".json") and not filename.endswith(".yaml"):
                 self.show_error_message("File must be a YAML or JSON file")
                 return
 
-            self.current_filename = filename
-            self.setWindowTitle("Dictionary Editor - " + filename)
-            self.populate(data)
+            if expanded is None:
+                if self.current_filename and os.path.abspath(filename) != os.path.abspath(self.current_filename):
+                    self.expansion.put(self.current_filename, self.get_expanded())
+                expanded = self.expansion.get(filename)
+
+            self.cancel_load()
+            if self.indexer is not None:
+                self.indexer.cancelled = True
+            # A save under way is let finish first, as the file may be the same
+            self.save_pool.waitForDone()
+            loader = LoadWorker(filename, self.libyaml.get_value(), self.mapped_json.get_value())
+            loader.signals.progress.connect(self.progress.setValue)
+            loader.signals.loaded.connect(lambda data: self.file_loaded(loader, data, expanded))
+            loader.signals.failed.connect(lambda message: self.load_failed(loader, message))
+            self.loader = loader
+            self.progress.setValue(0)
+            self.show_progress(True)
+            self.statusBar().showMessage("Loading " + filename)
+            QtCore.QThreadPool.globalInstance().start(loader)
+
+    def file_loaded(self, loader, data, expanded):
+        if loader is not self.loader:
+            return
+        self.finish_load()
+        self.current_filename = loader.filename
+        self.mapped = loader.mapped
+        self.source_stat = loader.stat
+        self.setWindowTitle("Dictionary Editor - " + loader.filename)
+        self.populate(data)
+        if expanded is not None:
+            self.set_expanded(expanded)
+        self.watch_file()
+
+    def watch_file(self):
+        if self.watcher.files():
+            self.watcher.removePaths(self.watcher.files())
+        # Mapped files would have to be read whole to compare them
+        if self.auto_refresh.get_value() and self.current_filename and not self.mapped and os.path.exists(self.current_filename):
+            self.watcher.addPath(self.current_filename)
+
+    def file_changed(self, path):
+        # A file replaced by a rename is no longer watched
+        if path not in self.watcher.files() and os.path.exists(path):
+            self.watcher.addPath(path)
+        self.reload_timer.start()
+
+    def reload_changed(self):
+        if not self.auto_refresh.get_value() or self.loader is not None or self.saver is not None:
+            return
+        elif self.file_stat(self.current_filename) in [None, self.source_stat]:
+            # Gone, or our own save
+            return
+        elif self.tree_widget.model().dirty:
+            self.statusBar().showMessage("{} changed on disk, keeping the unsaved edits".format(self.current_filename), 5000)
+            return
+        reloader = LoadWorker(self.current_filename, self.libyaml.get_value())
+        reloader.signals.loaded.connect(lambda data: self.file_reloaded(reloader, data))
+        reloader.signals.failed.connect(lambda message: self.reload_failed(reloader, message))
+        self.reloader = reloader
+        QtCore.QThreadPool.globalInstance().start(reloader)
+
+    def file_reloaded(self, reloader, data):
+        model = self.tree_widget.model()
+        if reloader is not self.reloader or reloader.filename != self.current_filename or model.dirty or model.locked:
+            return
+        self.reloader = None
+        # Filtered again once the changes are indexed
+        self.tree_widget.clear_filter()
+        model.update_data(data)
+        self.source_stat = reloader.stat
+        self.statusBar().showMessage("Refreshed " + reloader.filename, 2000)
+
+    def reload_failed(self, reloader, message):
+        if reloader is self.reloader:
+            # Likely caught half written: the next change reloads it again
+            self.reloader = None
+            self.statusBar().showMessage("Error refreshing {}: {}".format(reloader.filename, message), 5000)
+
+    def load_failed(self, loader, message):
+        if loader is not self.loader:
+            return
+        self.finish_load()
+        self.show_error_message("Error loading {}: {}".format(loader.filename, message))
+
+    def cancel_load(self):
+        if self.loader is not None:
+            self.loader.cancelled = True
+            self.finish_load()
+
+    def finish_load(self):
+        self.loader = None
+        self.show_progress(False)
+        self.statusBar().clearMessage()
+
+    def show_progress(self, visible):
+        self.progress.setVisible(visible)
+        self.cancel_button.setVisible(visible)
 
     def populate(self, data):
         try:
-            self.tree_widget.clear()
-            self.tree_widget.populate_tree(data, None)
-            self.tree_widget.resizeColumnToContents(0)
-            self.tree_widget.resizeColumnToContents(1)
+            self.tree_widget.model().set_data(data)
+            self.tree_widget.resize_column(shrink=True)
         except Exception as e:
             self.show_error_message("Error populating tree" + str(e))
 
-    def get_expanded_recursive(self):
-        expanded = []
-
-        def traverse(item):
-            expanded.append(item.isExpanded())
-            for i in range(item.childCount()):
-                traverse(item.child(i))
+    def get_expanded(self):
+        return self.tree_widget.expanded_paths()
 
-        traverse(self.tree_widget.invisibleRootItem())
-        return expanded
-
-    def set_expanded_recursive(self, expanded):
-
-        def traverse(item):
-            item.setExpanded(expanded.pop(0))
-            for i in range(item.childCount()):
-                traverse(item.child(i))
-
-        traverse(self.tree_widget.invisibleRootItem())
+    def set_expanded(self, expanded):
+        self.tree_widget.expand_paths(expanded)
 
     def refresh(self):
-        v = self.get_expanded_recursive()
+        v = self.get_expanded()
         if self.current_filename:
-            self.open_file(self.current_filename)
-            self.set_expanded_recursive(v)
+            self.open_file(self.current_filename, v)
+
+    def build_index(self):
+        if self.indexer is not None:
+            self.indexer.cancelled = True
+        indexer = IndexWorker(self.tree_widget.model().to_python())
+        indexer.signals.built.connect(lambda index: self.index_built(indexer, index))
+        indexer.signals.failed.connect(lambda message: self.index_failed(indexer))
+        self.indexer = indexer
+        QtCore.QThreadPool.globalInstance().start(indexer)
+
+    def index_built(self, indexer, index):
+        if indexer is not self.indexer:
+            return
+        self.indexer = None
+        self.search_index = index
+        if indexer.edited:
+            self.index_timer.start()
+        self.search()
+
+    def index_failed(self, indexer):
+        if indexer is self.indexer:
+            self.indexer = None
+            self.index_timer.start()
+
+    def entry_edited(self, path, old_key, old_value, new_key, new_value):
+        if new_key != old_key:
+            self.clear_path_cache()
+        if self.indexer is not None:
+            self.indexer.edited = True
+        if self.search_index is not None:
+            self.search_index.edit(path, old_key, old_value, new_key, new_value)
+
+    def clear_path_cache(self):
+        self.path_cache.clear()
+        self.path_rows.clear()
+
+    def focus_path(self):
+        self.path_edit.setFocus()
+        self.path_edit.selectAll()
+
+    def show_path(self, index):
+        if index.isValid() and not self.path_edit.hasFocus():
+            model = self.tree_widget.model()
+            self.path_edit.setText(paths.format_path(model.get_path(model.node(index.siblingAtColumn(0)))))
+
+    def go_to_path(self):
+        text = self.path_edit.text()
+        try:
+            path = paths.parse_path(text)
+        except ValueError as e:
+            self.statusBar().showMessage(str(e), 5000)
+            return
+        index = self.path_cache.get(path)
+        index = QtCore.QModelIndex(index) if index is not None and index.isValid() else QtCore.QModelIndex()
+        if not index.isValid():
+            # Builds only the rows up to each step of the path
+            index = self.tree_widget.model().find_path(path, self.path_rows, loose=True)
+            if not index.isValid():
+                self.statusBar().showMessage("Nothing at " + text, 5000)
+                return
+            self.path_cache[path] = QtCore.QPersistentModelIndex(index)
+        # scrollTo expands the ancestors
+        self.tree_widget.setCurrentIndex(index)
+        self.tree_widget.scrollTo(index)
+        self.tree_widget.expand(index)
+        self.tree_widget.setFocus()
+
+    def focus_search(self):
+        self.search_edit.setFocus()
+        self.search_edit.selectAll()
+
+    def search(self):
+        text = self.search_edit.text()
+        self.match = -1
+        if not text.strip():
+            self.matches = []
+            self.statusBar().clearMessage()
+        elif self.search_index is None:
+            self.matches = []
+            self.statusBar().showMessage("Indexing...")
+        else:
+            self.matches = self.search_index.lookup(text)
+            self.statusBar().showMessage("{} matches".format(len(self.matches)))
+        self.filter_timer.start()
+
+    def apply_filter(self):
+        if not self.filter_check.isChecked() or not self.matches:
+            self.tree_widget.clear_filter()
+        elif len(self.matches) > self.FILTER_LIMIT:
+            self.tree_widget.clear_filter()
+            self.statusBar().showMessage("{} matches, too many to filter".format(len(self.matches)))
+        else:
+            self.tree_widget.filter_paths([self.search_index.path(entry) for entry in self.matches])
+
+    def next_match(self):
+        if not self.matches:
+            return
+        self.match = (self.match + 1) % len(self.matches)
+        index = self.tree_widget.model().find_path(self.search_index.path(self.matches[self.match]))
+        if index.isValid():
+            # scrollTo expands the ancestors
+            self.tree_widget.setCurrentIndex(index)
+            self.tree_widget.scrollTo(index)
+        self.statusBar().showMessage("Match {} of {}".format(self.match + 1, len(self.matches)))
 
     def closeEvent(self, a0):
         print("akkkkkkkkkkk", self.current_filename)
-        v = self.get_expanded_recursive()
-        expanded = ""
-        for e in v:
-            expanded += "1" if e else "0"
+        self.cancel_load()
+        if self.indexer is not None:
+            self.indexer.cancelled = True
+        # A save under way is let finish, or the file would not be written
+        self.save_pool.waitForDone()
+        if self.current_filename:
+            self.expansion.put(self.current_filename, self.get_expanded())
+            self.expansion.save()
 
         geometry = [self.geometry().x(), self.geometry().y(), self.geometry().width(), self.geometry().height()]
         self.pose.set_value(geometry)
         self.filename.set_value(self.current_filename)
-        self.expanded.set_value(expanded)
         self.config.save(self.config_file)
 
         super().closeEvent(a0)
@@ -0,0 +1,70 @@
+import json
+import os
+
+import yaml
+
+from dicteditor.core import codecs
+
+# Keys JSON keeps as they are; others, like the dates YAML gives for
+# 2024-01-01, are stored tagged as {"yaml": text}
+JSON_KEYS = [str, int, float, bool, type(None)]
+
+
+def encode_key(key):
+    return key if type(key) in JSON_KEYS else {"yaml": yaml.safe_dump(key)}
+
+
+def decode_key(key):
+    return yaml.safe_load(key["yaml"]) if type(key) == dict else key
+
+
+class ExpansionStore:
+    # Expanded key paths of the recently opened files, least recently used
+    # first. Kept in its own file so the preferences stay small.
+
+    def __init__(self, filename, max_files=50, max_paths=2000):
+        self.filename = filename
+        self.max_files = max_files
+        self.max_paths = max_paths
+        self.files = {}
+
+    def load(self):
+        try:
+            with open(self.filename, "r") as f:
+                files = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(files, dict):
+            self.files = files
+
+    def save(self):
+        # Serialized first, so a failure cannot leave the file half written
+        text = json.dumps(self.files, separators=(",", ":")).encode()
+        with codecs.atomic_open(self.filename) as f:
+            f.write(text)
+
+    def get(self, filename):
+        paths = self.files.get(os.path.abspath(filename))
+        if paths is None:
+            return None
+        try:
+            return {tuple(decode_key(key) for key in path) for path in paths}
+        except (TypeError, KeyError, yaml.YAMLError):
+            return None
+
+    def put(self, filename, paths):
+        filename = os.path.abspath(filename)
+        self.files.pop(filename, None)
+        # Shallow paths first, so the cap drops the deepest ones
+        encoded = []
+        for path in sorted(paths, key=len):
+            try:
+                encoded.append([encode_key(key) for key in path])
+            except yaml.YAMLError:
+                # Keys that are not even YAML are not kept
+                continue
+            if len(encoded) == self.max_paths:
+                break
+        self.files[filename] = encoded
+        while len(self.files) > self.max_files:
+            del self.files[next(iter(self.files))]
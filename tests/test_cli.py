@@ -0,0 +1,79 @@
+import json
+
+import pytest
+import yaml
+
+from dicteditor import cli
+
+
+@pytest.fixture
+def files(tmp_path):
+    document = {"spec": {"replicas": 2, "containers": [{"image": "nginx"}]}, "debug": True}
+    yaml_file, json_file = tmp_path / "a.yaml", tmp_path / "b.json"
+    yaml_file.write_text(yaml.safe_dump(document, sort_keys=False))
+    json_file.write_text(json.dumps(document))
+    return [str(yaml_file), str(json_file)]
+
+
+def load(filename):
+    with open(filename) as f:
+        return yaml.safe_load(f)
+
+
+def test_get(files):
+    for filename in files:
+        assert cli.process("get", ("spec", "containers", 0, "image"), None, filename) == (filename, '"nginx"', None)
+        assert json.loads(cli.process("get", (), None, filename)[1])["debug"] is True
+
+
+def test_set(files):
+    for filename in files:
+        assert cli.process("set", ("spec", "replicas"), 5, filename) == (filename, None, None)
+        assert load(filename)["spec"]["replicas"] == 5
+
+
+def test_set_new_key(files):
+    for filename in files:
+        assert cli.process("set", ("spec", "paused"), False, filename)[2] is None
+        assert load(filename)["spec"]["paused"] is False
+
+
+def test_del(files):
+    for filename in files:
+        assert cli.process("del", ("debug",), None, filename)[2] is None
+        assert "debug" not in load(filename)
+
+
+def test_missing_path(files):
+    for filename in files:
+        for command in ["get", "set", "del"]:
+            _, output, error = cli.process(command, ("spec", "nope", "x"), 1, filename)
+            assert output is None and error
+        # Nothing written
+        assert load(filename)["spec"]["replicas"] == 2
+
+
+def test_parse_error(tmp_path):
+    broken = tmp_path / "broken.json"
+    broken.write_text('{"a": ')
+    _, output, error = cli.process("get", ("a",), None, str(broken))
+    assert output is None and error
+    assert broken.read_text() == '{"a": '
+
+
+def test_keep_format(files):
+    with open(files[0], "a") as f:
+        f.write("# end\n")
+    assert cli.process("set", ("spec", "replicas"), 3, files[0], keep_format=True)[2] is None
+    with open(files[0]) as f:
+        assert f.read().endswith("# end\n")
+
+
+def test_run_exit_status(files, tmp_path, capsys):
+    assert cli.run(["-j", "1", "set", "spec.replicas", "7"] + files) == 0
+    assert cli.run(["-j", "2", "get", "spec.replicas"] + files) == 0
+    out = capsys.readouterr().out
+    assert out.splitlines() == ["{}: 7".format(filename) for filename in files]
+    assert cli.run(["-j", "1", "get", "spec.nope"] + files) == 1
+    assert cli.run(["-j", "1", "get", "spec.replicas", str(tmp_path / "missing.yaml")]) == 1
+    assert "2 errors" in capsys.readouterr().err
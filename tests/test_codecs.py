@@ -0,0 +1,134 @@
+import array
+import io
+import json
+import os
+import stat
+
+import pytest
+import yaml
+
+from dicteditor.core import codecs
+
+
+def test_patch_keeps_yaml_aliases(tmp_path):
+    # An alias shares its node, and text, with the anchor: patching through
+    # it would rewrite the anchor and leave the alias undefined
+    filename = str(tmp_path / "aliases.yaml")
+    with open(filename, "w") as f:
+        f.write("base: &b 80\nsvc: {port: *b}\n")
+    data = codecs.load_file(filename)
+    data["svc"] = dict(data["svc"], port=81)
+    assert not codecs.patch_file(filename, data, {("svc", "port")})
+    codecs.write_document(filename, data, {("svc", "port")})
+    with open(filename) as f:
+        assert yaml.safe_load(f) == {"base": 80, "svc": {"port": 81}}
+
+
+def test_patch_keeps_yaml_formatting(tmp_path):
+    filename = str(tmp_path / "plain.yaml")
+    with open(filename, "w") as f:
+        f.write("# ports\nbase: 80  # http\nsvc: {port: 443}\n")
+    data = codecs.load_file(filename)
+    data["svc"]["port"] = 8443
+    assert codecs.patch_file(filename, data, {("svc", "port")})
+    with open(filename) as f:
+        assert f.read() == "# ports\nbase: 80  # http\nsvc: {port: 8443}\n"
+
+
+def test_save_writes_through_symlinks(tmp_path):
+    real, link = tmp_path / "real.json", tmp_path / "link.json"
+    real.write_text('{"a": 1}')
+    link.symlink_to(real)
+    codecs.save_file(str(link), {"a": 2})
+    assert link.is_symlink()
+    assert real.read_text() == '{"a": 2}'
+
+
+def test_new_files_get_the_default_mode(tmp_path):
+    # Not the 0600 of mkstemp()
+    filename = str(tmp_path / "new.json")
+    codecs.save_file(filename, {"a": 1})
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o666 & ~codecs.UMASK
+
+
+def test_saves_keep_the_mode(tmp_path):
+    filename = tmp_path / "kept.yaml"
+    filename.write_text("a: 1\n")
+    filename.chmod(0o640)
+    codecs.save_file(str(filename), {"a": 2})
+    assert stat.S_IMODE(filename.stat().st_mode) == 0o640
+
+
+def test_compact_lists():
+    data = {"ints": list(range(5)), "mixed": [1, 2.0, 3], "nested": [[0.5] * 5], "big": [2 ** 70] * 5}
+    data = codecs.compact_lists(data, min_length=5)
+    assert data["ints"] == array.array("q", range(5))
+    assert type(data["mixed"]) == list
+    assert data["nested"][0] == array.array("d", [0.5] * 5)
+    # Too large for 64 bits
+    assert type(data["big"]) == list
+    assert type(codecs.compact_lists(list(range(4)), min_length=5)) == list
+
+
+def mapped(tmp_path, monkeypatch, document):
+    # Small containers indexed too, so that a small file has undecoded parts
+    monkeypatch.setattr(codecs, "INDEX_MIN_SIZE", 32)
+    filename = tmp_path / "mapped.json"
+    filename.write_text(json.dumps(document))
+    return str(filename)
+
+
+DOCUMENT = {"logs": [{"i": i, "msg": "line {}".format(i)} for i in range(20)], "state": {"ok": True, "names": ["a", "b"]}, "n": 1}
+
+
+def test_mapped_json_decodes_on_load(tmp_path, monkeypatch):
+    data = codecs.load_file(mapped(tmp_path, monkeypatch, DOCUMENT), mapped=True)
+    assert type(data["logs"]) == codecs.LazyContainer and data["logs"].kind == list
+    assert data["n"] == 1
+    logs = data["logs"].load()
+    assert logs == DOCUMENT["logs"]
+    assert codecs.MappedJson(str(tmp_path / "mapped.json")).root().keys() == DOCUMENT.keys()
+
+
+def test_write_json_copies_undecoded_parts(tmp_path, monkeypatch):
+    data = codecs.load_file(mapped(tmp_path, monkeypatch, DOCUMENT), mapped=True)
+    data["n"] = 2
+    stream = io.BytesIO()
+    codecs.write_json(data, stream)
+    assert json.loads(stream.getvalue()) == dict(DOCUMENT, n=2)
+    # Same bytes as a full dump, once nothing is left undecoded
+    data["state"] = data["state"].load()
+    stream = io.BytesIO()
+    codecs.write_json(data, stream)
+    assert stream.getvalue() == json.dumps(dict(DOCUMENT, n=2)).encode()
+
+
+def test_mapped_json_errors(tmp_path):
+    filename = tmp_path / "broken.json"
+    for text in ['{"a": [1, 2}', '{"a": 1']:
+        filename.write_text(text)
+        with pytest.raises(ValueError):
+            codecs.MappedJson(str(filename))
+
+
+def test_json_span():
+    source = b'{"a": [1, {"b": "x,]"}, 3], "c" : {"d": null}, "e": "\\"q"}'
+    def span(path):
+        found = codecs.json_span(source, path)
+        return source[found[0]:found[1]] if found else None
+    assert span(("a", 1, "b")) == b'"x,]"'
+    assert span(("a", 2)) == b"3"
+    assert span(("c",)) == b'{"d": null}'
+    assert span(("c", "d")) == b"null"
+    assert span(("e",)) == b'"\\"q"'
+    assert span(("a", 3)) is None
+    assert span(("z",)) is None
+
+
+def test_patch_json_keeps_formatting(tmp_path):
+    filename = tmp_path / "plain.json"
+    filename.write_text('{\n  "a": 1,\n  "b": {"c": [1, 2]}\n}\n')
+    data = codecs.load_file(str(filename))
+    data["b"]["c"][1] = "two"
+    assert codecs.patch_file(str(filename), data, {("b", "c", 1)})
+    assert filename.read_text() == '{\n  "a": 1,\n  "b": {"c": [1, "two"]}\n}\n'
@@ -0,0 +1,30 @@
+import array
+
+from dicteditor.core import diff
+
+
+def test_same_tells_equal_values_of_other_types_apart():
+    assert diff.same({"a": 1, "b": [1.5, "x"]}, {"a": 1, "b": [1.5, "x"]})
+    assert not diff.same({"a": 1, "b": 1.0}, {"a": True, "b": 1})
+    assert not diff.same([1], [1.0])
+    assert not diff.same({1: "x"}, {True: "x"})
+
+
+def test_same_minds_key_order():
+    assert {"a": 1, "b": 2} == {"b": 2, "a": 1}
+    assert not diff.same({"a": 1, "b": 2}, {"b": 2, "a": 1})
+
+
+def test_same_compares_arrays_by_typecode():
+    assert diff.same(array.array("q", [1, 2]), array.array("q", [1, 2]))
+    assert not diff.same(array.array("q", [1, 2]), array.array("d", [1, 2]))
+    assert not diff.same(array.array("q", [1, 2]), [1, 2])
+
+
+def test_dict_changes():
+    assert diff.dict_changes({"a": 1, "b": 2, "c": 3}, {"a": 1, "c": 4, "d": 5}) == (["b"], ["a", "c"], ["d"])
+    # Reordered, or keys changing type, cannot be patched
+    assert diff.dict_changes({"a": 1, "b": 2}, {"b": 2, "a": 1}) is None
+    assert diff.dict_changes({1: "x"}, {True: "x"}) is None
+    # Added keys must come after the kept ones
+    assert diff.dict_changes({"a": 1}, {"z": 0, "a": 1}) is None
@@ -0,0 +1,72 @@
+from dicteditor.core import document
+from dicteditor.core.document import Node, get_elem_from_text
+
+
+def test_text_as_shown_keeps_the_value():
+    value = "007"
+    assert get_elem_from_text("007", value) is value
+
+
+def test_strings_stay_strings():
+    assert get_elem_from_text("1.1", "1.0") == "1.1"
+    assert get_elem_from_text("null", "x") == "null"
+    assert get_elem_from_text("true", "x") == "true"
+
+
+def test_numbers_keep_their_type():
+    assert get_elem_from_text("7", 3) == 7
+    assert type(get_elem_from_text("7", 3.5)) == float
+    assert get_elem_from_text("7.5", 3) == 7.5
+    assert get_elem_from_text("abc", 2) == "abc"
+
+
+def test_other_values_are_inferred():
+    assert get_elem_from_text("5") == 5
+    assert get_elem_from_text("true", None) is True
+    assert get_elem_from_text("~", False) is None
+
+
+def test_tags_change_the_type():
+    assert get_elem_from_text("!!float 1.1", "1.0") == 1.1
+    assert get_elem_from_text("!!null", "x") is None
+    assert get_elem_from_text("!!str 5", 5) == "5"
+    assert get_elem_from_text("!!int x", "a") == "!!int x"
+
+
+def test_tags_only_give_json_scalars():
+    # Sets are unhashable keys, and bytes and dates cannot be saved as JSON
+    for text in ["!!set {x}", "!!binary aGk=", "!!timestamp 2024-01-01", "!!map {a: 1}", "!!seq [1]"]:
+        assert get_elem_from_text(text, "x") == text
+
+
+def test_node_fetches_in_batches():
+    node = Node(None, None, {"k{}".format(i): i for i in range(10)})
+    assert node.total_rows() == 10 and node.can_fetch()
+    node.fetch(4)
+    assert [child.key for child in node.children] == ["k0", "k1", "k2", "k3"]
+    node.fetch()
+    assert len(node.children) == 10 and not node.can_fetch()
+    assert node.children[7].position() == "k7"
+
+
+def test_node_restarts_after_entries_change():
+    values = list(range(10))
+    node = Node(None, None, values)
+    node.fetch(3)
+    del values[5]
+    values.append(10)
+    node.restart()
+    node.fetch()
+    assert [child.value for child in node.children] == [0, 1, 2, 3, 4, 6, 7, 8, 9, 10]
+    assert [child.position() for child in node.children] == list(range(10))
+
+
+def test_long_lists_are_grouped(monkeypatch):
+    monkeypatch.setattr(document, "GROUP_SIZE", 4)
+    node = Node(None, None, list(range(10)))
+    node.fetch()
+    assert [(group.start, group.count) for group in node.children] == [(0, 4), (4, 4), (8, 2)]
+    group = node.children[2]
+    group.fetch()
+    assert [child.value for child in group.children] == [8, 9]
+    assert group.children[1].position() == 9 and group.children[1].owner() is node
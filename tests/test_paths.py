@@ -0,0 +1,43 @@
+import array
+
+import pytest
+
+from dicteditor.core import paths
+
+
+def test_parse_path():
+    assert paths.parse_path("spec.containers[3].env") == ("spec", "containers", 3, "env")
+    assert paths.parse_path("$['spec']['containers'][-1]") == ("spec", "containers", -1)
+    assert paths.parse_path('$.a["b.c"]') == ("a", "b.c")
+    assert paths.parse_path(r"['it\'s']") == ("it's",)
+    # Dotted digits stay text
+    assert paths.parse_path("a.0") == ("a", "0")
+    assert paths.parse_path("") == ()
+
+
+@pytest.mark.parametrize("text", ["a[x", "a..b", "a]", "[1"])
+def test_parse_path_errors(text):
+    with pytest.raises(ValueError):
+        paths.parse_path(text)
+
+
+def test_format_path_round_trips():
+    for path in [("spec", "containers", 3, "env"), ("a.b", "c d", 0), ("[x]",), ()]:
+        assert paths.parse_path(paths.format_path(path)) == path
+    assert paths.format_path(("spec", 3)) == "$.spec[3]"
+
+
+def test_locate():
+    data = {"spec": {"ports": [80, 443]}, 5: "five", "n": array.array("q", [1, 2, 3])}
+    assert paths.locate(data, ("spec", "ports", -1)) == (data["spec"]["ports"], 1, ("spec", "ports", 1))
+    # Loose steps: digits as positions, text as keys of any type
+    assert paths.locate(data, ("spec", "ports", "0"))[2] == ("spec", "ports", 0)
+    assert paths.locate(data, ("5",))[1] == 5
+    assert paths.locate(data, ("n", 2))[2] == ("n", 2)
+    assert paths.locate(data, ()) == (None, None, ())
+
+
+@pytest.mark.parametrize("path", [("nope",), ("spec", "ports", 2), ("spec", "ports", "x"), ("spec", "ports", 0, "a")])
+def test_locate_errors(path):
+    with pytest.raises(KeyError):
+        paths.locate({"spec": {"ports": [80, 443]}}, path)
@@ -0,0 +1,42 @@
+from dicteditor.core.search import SearchIndex
+
+DOCUMENT = {
+    "server": {"host": "example.org", "port": 8080},
+    "users": [{"name": "Alice Smith"}, {"name": "bob"}],
+}
+
+
+def test_build_numbers_entries_in_document_order():
+    index = SearchIndex().build(DOCUMENT)
+    assert [index.path(entry) for entry in range(len(index))] == [
+        (), ("server",), ("server", "host"), ("server", "port"),
+        ("users",), ("users", 0), ("users", 0, "name"), ("users", 1), ("users", 1, "name")]
+    # Each entry's descendants run up to its end
+    assert index.ends[index.find(("users",))] == len(index)
+    assert index.find(("users", 1, "name")) == len(index) - 1
+    assert index.find(("users", 2)) is None
+
+
+def test_lookup():
+    index = SearchIndex().build(DOCUMENT)
+    paths = lambda text: [index.path(entry) for entry in index.lookup(text)]
+    # Keys and values, by word prefix and case-insensitively
+    assert paths("host") == [("server", "host")]
+    assert paths("exam") == [("server", "host")]
+    assert paths("SMITH ali") == [("users", 0, "name")]
+    assert paths("name") == [("users", 0, "name"), ("users", 1, "name")]
+    assert paths("8080") == [("server", "port")]
+    assert paths("alice bob") == []
+    assert paths("") == []
+
+
+def test_edit():
+    index = SearchIndex().build(DOCUMENT)
+    entry = index.find(("users", 1, "name"))
+    index.edit(("users", 1, "name"), "name", "bob", "login", "carol")
+    assert index.lookup("bob") == []
+    assert index.lookup("carol") == [entry]
+    assert index.lookup("login") == [entry]
+    assert index.find(("users", 1, "login")) == entry
+    # Words no entry has any more are gone from the prefix lookup too
+    assert "bob" not in index.vocabulary